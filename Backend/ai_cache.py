@@ -0,0 +1,125 @@
+"""
+LRU + TTL cache for deterministic Gemini responses.
+
+Bank and platform notices repeat across users with only the amount, the
+account number or the date changed. mask_message() swaps those for
+numbered placeholders (<AMOUNT_1>, <ACCOUNT_1>, <DATE_1>), so the masked
+text is both the cache key and what the model is asked about; the
+caller puts the real values back into the answer with unmask(). Keys are
+SHA-256 digests of the namespace plus the normalised text, so raw
+messages are never kept as keys.
+
+Entries expire after `ttl_s` seconds and the least recently used ones are
+evicted once either `max_entries` or `max_bytes` (estimated from the
+JSON size of the value) is exceeded.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_MASKS = [
+    ("ACCOUNT", re.compile(r"\b[Xx*]{2,}\d{2,}\b|\b\d{9,}\b")),
+    ("AMOUNT", re.compile(r"(?:\b(?:rs|inr)\.?|₹)\s*\d[\d,]*(?:\.\d+)?", re.IGNORECASE)),
+    ("DATE", re.compile(r"\b\d{1,2}[-/ ](?:\d{1,2}|[A-Za-z]{3})[-/ ]\d{2,4}\b")),
+]
+
+
+def mask_message(text):
+    """Return (masked text, {placeholder: original}) with amounts, account numbers and dates masked."""
+    values = {}
+    for label, pattern in _MASKS:
+        count = 0
+
+        def swap(match):
+            nonlocal count
+            count += 1
+            placeholder = f"<{label}_{count}>"
+            values[placeholder] = match.group(0)
+            return placeholder
+
+        text = pattern.sub(swap, text)
+    return text, values
+
+
+def unmask(text, values):
+    for placeholder, original in values.items():
+        text = text.replace(placeholder, original)
+    return text
+
+
+def cache_key(namespace, text):
+    normalised = " ".join(text.lower().split())
+    return hashlib.sha256(f"{namespace}\0{normalised}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe LRU cache with per-entry TTL and an approximate memory cap."""
+
+    def __init__(self, max_entries=2048, max_bytes=16 * 1024 * 1024, ttl_s=86400):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()   # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Cached value, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value):
+        size = len(key) + len(json.dumps(value, ensure_ascii=False, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl_s, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
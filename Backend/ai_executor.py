@@ -0,0 +1,95 @@
+"""
+Bounded thread pool for blocking Gemini SDK calls.
+
+google-generativeai's generate_content is synchronous. Calling it from an
+async endpoint stalls the whole event loop until the model answers, so
+every AI call is handed to this pool instead and awaited. At most
+`max_concurrency` calls run at once; the rest wait in the pool's queue,
+and stats() reports how deep that queue is and how long calls waited.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _percentiles(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return {
+        "p50": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p99": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+        "max": round(ordered[-1] * 1000, 3),
+        "samples": len(ordered),
+    }
+
+
+class AIExecutor:
+    """Runs blocking callables on a fixed-size pool and keeps queue/latency metrics."""
+
+    def __init__(self, max_concurrency=8):
+        self.max_concurrency = max_concurrency
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="ai")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.peak_queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self._waits = deque(maxlen=4096)
+        self._runs = deque(maxlen=4096)
+
+    async def run(self, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) on the pool without blocking the event loop."""
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+
+        def task():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self._waits.append(started - submitted)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self._runs.append(time.perf_counter() - started)
+
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._pool, task)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        with self._lock:
+            self.completed += 1
+        return result
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "running": self.running,
+                "queue_depth": self.queued,
+                "peak_queue_depth": self.peak_queued,
+                "completed": self.completed,
+                "failed": self.failed,
+                "quota_retries": self.retries,
+                "queue_wait_ms": _percentiles(self._waits),
+                "call_ms": _percentiles(self._runs),
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
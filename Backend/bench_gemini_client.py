@@ -0,0 +1,92 @@
+"""
+ArthikSetu — Offline benchmark of the per-call cost of getting a Gemini model.
+No request is sent; it times only what happens before generate_content
+reaches the network:
+
+  configure_per_call  genai.configure + new GenerativeModel + default client
+                      (what every call did before the key pool and model
+                      cache; configure() drops genai's cached clients)
+  client_per_key      new GenerativeModel bound to a cached per-key client
+  cached_model        gemini_service.configure_gemini (model cache hit)
+
+Run:  python bench_gemini_client.py --iterations 2000 --output bench_gemini.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+
+import gemini_service
+
+MODEL = "gemini-2.5-flash"
+FAKE_KEY = "bench-key-0000"   # never used for a request
+
+
+def configure_per_call():
+    genai.configure(api_key=FAKE_KEY)
+    model = genai.GenerativeModel(MODEL)
+    model._client = genai_client.get_default_generative_client()
+    return model
+
+
+def client_per_key():
+    model = genai.GenerativeModel(MODEL)
+    with gemini_service._models_lock:
+        model._client = gemini_service._client_for(FAKE_KEY)
+    return model
+
+
+def cached_model():
+    return gemini_service.configure_gemini(FAKE_KEY, MODEL)
+
+
+def time_calls(fn, iterations):
+    fn()  # warm-up: imports, first client
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - started
+    return {"iterations": iterations, "us_per_call": round(elapsed / iterations * 1e6, 2)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--iterations", type=int, default=2000)
+    ap.add_argument("--output", help="write results as JSON")
+    args = ap.parse_args()
+
+    results = {}
+    for name, fn, iterations in [
+        ("configure_per_call", configure_per_call, max(1, args.iterations // 10)),
+        ("client_per_key", client_per_key, args.iterations),
+        ("cached_model", cached_model, args.iterations * 10),
+    ]:
+        results[name] = time_calls(fn, iterations)
+        print(f"{name:<20} {results[name]['us_per_call']:>12,.2f} µs/call  ({iterations} calls)")
+
+    baseline = results["configure_per_call"]["us_per_call"]
+    saved = round(baseline - results["cached_model"]["us_per_call"], 2)
+    print(f"\nSaved per call vs configure_per_call: {saved:,.2f} µs")
+
+    if args.output:
+        report = {
+            "timestamp": datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "genai": genai.__version__,
+            "results": results,
+            "saved_us_per_call": saved,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+ArthikSetu — Offline throughput benchmark for the rule-based SMS parser.
+Generates a deterministic synthetic SMS corpus and measures messages/second
+and peak memory for SMSParser.extract_info, parse_batch and parse_batch_compact.
+
+Run:      python bench_sms_parser.py --sizes 1000 100000 1000000
+Compare:  python bench_sms_parser.py --output new.json --compare old.json
+"""
+
+import argparse
+import gc
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from sms_parser import SMSParser
+
+# ─── Synthetic corpus ─────────────────────────────────────────────────
+# (weight, templates) — proportions roughly follow a gig worker's inbox,
+# where OTPs, promotions and chat far outnumber payouts.
+
+PLATFORMS = ["Zomato", "Swiggy", "Zepto", "Blinkit", "Dunzo", "Uber", "Ola",
+             "Porter", "Rapido", "Urban Company", "Amazon Flex", "Flipkart"]
+BANKS = ["HDFC Bank", "SBI", "ICICI Bank", "Axis Bank", "Kotak"]
+SHOPS = ["DMart", "Reliance Fresh", "BigBazaar", "Indian Oil", "Apollo Pharmacy"]
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+CATEGORIES = {
+    "platform_payout": (0.15, [
+        "Rs {amount} credited to your a/c XX{acct} on {dmy_text} by {platform} PAYOUT. Avl bal Rs {balance}.",
+        "{platform}: Your weekly payout of Rs.{amount} has been deposited to your bank account XX{acct}.",
+        "INR {amount} received from {platform} settlement on {dmy_num}. Ref {ref}.",
+        "Dear partner, {platform} incentive of ₹{amount} credited for trips completed on {mdy}.",
+    ]),
+    "platform_debit": (0.05, [
+        "Your UPI transaction to {platform} for Rs.{amount} is successful. Ref no {ref}.",
+        "Rs {amount} paid to {platform} on {dmy_text} via UPI. UPI Ref {ref}.",
+    ]),
+    "bank_debit": (0.20, [
+        "INR {amount} debited from A/c XX{acct} on {dmy_num} towards POS purchase at {shop}. Avl Bal INR {balance}.",
+        "Rs.{amount} spent on your {bank} card ending {acct} at {shop} on {dmy_text}.",
+        "A/c XX{acct} debited by Rs {amount} on {dmy_num}. Transferred to {name}. -{bank}",
+    ]),
+    "otp": (0.25, [
+        "{otp} is your OTP for login. Do not share it with anyone. -{bank}",
+        "Use OTP {otp} to verify your {platform} account. Valid for 10 minutes.",
+        "Your one time password is {otp}. Never share your OTP with anyone.",
+    ]),
+    "promotion": (0.15, [
+        "Get flat {pct}% off on your next order! Use code SAVE{pct}. T&C apply.",
+        "Your {bank} credit card is pre-approved for a limit of Rs {balance}. Apply now!",
+        "Mega sale is live! Up to {pct}% off on electronics. Shop now.",
+    ]),
+    "noise": (0.20, [
+        "Hey, are we meeting tomorrow evening at the usual place?",
+        "Call me when you are free, need to discuss something important.",
+        "Happy birthday! Have a wonderful year ahead.",
+        "Your electricity bill for {mon} is generated. Pay before due date to avoid late fee.",
+    ]),
+}
+
+NAMES = ["Ravi", "Priya", "Amit", "Sunita", "Rahul", "Anjali"]
+
+
+def _fill(template, rng):
+    day, month, year = rng.randint(1, 28), rng.randint(1, 12), rng.choice([24, 25, 2024, 2025])
+    return template.format(
+        amount=f"{rng.randint(50, 25000):,}",
+        balance=f"{rng.randint(1000, 250000):,}",
+        acct=rng.randint(1000, 9999),
+        ref=rng.randint(10**11, 10**12 - 1),
+        otp=rng.randint(100000, 999999),
+        pct=rng.choice([10, 20, 30, 40, 50]),
+        platform=rng.choice(PLATFORMS),
+        bank=rng.choice(BANKS),
+        shop=rng.choice(SHOPS),
+        name=rng.choice(NAMES),
+        mon=rng.choice(MONTHS),
+        dmy_text=f"{day:02d}-{MONTHS[month - 1]}-{year % 100:02d}",
+        dmy_num=f"{day:02d}/{month:02d}/{year if year > 100 else 2000 + year}",
+        mdy=f"{MONTHS[month - 1]} {day}, {year if year > 100 else 2000 + year}",
+    )
+
+
+def generate_corpus(size, seed=42):
+    """Deterministic list of `size` synthetic SMS for a given seed."""
+    rng = random.Random(seed)
+    names = list(CATEGORIES)
+    weights = [CATEGORIES[name][0] for name in names]
+    messages = []
+    for category in rng.choices(names, weights=weights, k=size):
+        messages.append(_fill(rng.choice(CATEGORIES[category][1]), rng))
+    return messages
+
+
+# ─── Benchmarks ───────────────────────────────────────────────────────
+
+def _run_extract_info(parser, messages):
+    extract = parser.extract_info
+    for msg in messages:
+        extract(msg)
+
+
+def _run_parse_batch(parser, messages):
+    parser.parse_batch(messages)
+
+
+def _run_parse_batch_compact(parser, messages):
+    parser.parse_batch_compact(messages)
+
+
+TARGETS = {
+    "extract_info": _run_extract_info,
+    "parse_batch": _run_parse_batch,
+    "parse_batch_compact": _run_parse_batch_compact,
+}
+
+
+def measure(fn, parser, messages, repeat, track_memory):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn(parser, messages)
+        best = min(best, time.perf_counter() - start)
+
+    peak_bytes = None
+    if track_memory:
+        gc.collect()
+        tracemalloc.start()
+        fn(parser, messages)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "seconds": round(best, 6),
+        "messages_per_second": round(len(messages) / best, 1) if best > 0 else None,
+        "peak_memory_bytes": peak_bytes,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    old = {(r["target"], r["size"]): r for r in baseline["results"]}
+    print()
+    print(f"  Compared with {baseline_path} (commit {baseline.get('commit')})")
+    for r in current["results"]:
+        prev = old.get((r["target"], r["size"]))
+        if not prev or not prev["messages_per_second"]:
+            continue
+        delta = (r["messages_per_second"] / prev["messages_per_second"] - 1) * 100
+        print(f"    {r['target']:22s} {r['size']:>9,}  {delta:+7.1f}% msgs/s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    ap.add_argument("--targets", nargs="+", choices=list(TARGETS), default=list(TARGETS))
+    ap.add_argument("--repeat", type=int, default=3, help="timed runs per case; the best is kept")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak-memory pass")
+    ap.add_argument("--output", default="bench_results.json")
+    ap.add_argument("--compare", help="earlier results file to diff against")
+    args = ap.parse_args()
+
+    print("=" * 60)
+    print("  ArthikSetu — SMS Parser Benchmark")
+    print("=" * 60)
+
+    parser = SMSParser()
+    results = []
+    for size in args.sizes:
+        messages = generate_corpus(size, args.seed)
+        for target in args.targets:
+            # Large corpora are slow to repeat; one run is stable enough there
+            repeat = args.repeat if size <= 100_000 else 1
+            r = measure(TARGETS[target], parser, messages, repeat, not args.no_memory)
+            r.update({"target": target, "size": size})
+            results.append(r)
+            peak = f"{r['peak_memory_bytes'] / 2**20:8.1f} MiB" if r["peak_memory_bytes"] is not None else "       -"
+            print(f"  {target:22s} {size:>9,}  {r['messages_per_second']:>12,.0f} msgs/s  peak {peak}")
+        del messages
+
+    report = {
+        "generated_at": datetime.now().isoformat(),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print("-" * 60)
+    print(f"  Results written to {args.output}")
+
+    if args.compare:
+        compare(report, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
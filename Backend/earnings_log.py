@@ -0,0 +1,270 @@
+"""
+Append-only event log for the earnings store, so earnings survive a restart.
+
+Every store mutation is appended as one JSON line. A background thread
+writes pending lines in groups and fsyncs once per group (group commit), so
+concurrent writers share the cost of a disk flush. Every `snapshot_every`
+events the store hands over a compacted copy of its document; the log writes
+it atomically, starts a new segment and deletes segments the snapshot covers.
+Startup therefore reads the latest snapshot and replays only the tail.
+
+Directory layout:
+    snapshot.json                 {"seq": N, "doc": {...}}
+    events-000000000001.log       one event per line, named by first seq
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+SNAPSHOT_NAME = "snapshot.json"
+SEGMENT_PREFIX = "events-"
+SEGMENT_SUFFIX = ".log"
+
+
+def _segment_name(first_seq):
+    return f"{SEGMENT_PREFIX}{first_seq:012d}{SEGMENT_SUFFIX}"
+
+
+def _segment_start(filename):
+    return int(filename[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # e.g. Windows, where directories cannot be opened
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class EarningsEventLog:
+    """
+    Durable, append-only record of earnings mutations.
+
+    append() returns as soon as the event is queued; it is on disk within
+    about fsync_interval_ms. With sync_writes=True the caller should also
+    wait_durable() on the returned seq, after releasing its own locks so
+    other writers can join the same fsync. Call restore() once before the
+    first append.
+    """
+
+    def __init__(self, directory, fsync_interval_ms=10, snapshot_every=1000, sync_writes=False):
+        self.directory = directory
+        self.fsync_interval = fsync_interval_ms / 1000
+        self.snapshot_every = snapshot_every
+        self.sync_writes = sync_writes
+        os.makedirs(directory, exist_ok=True)
+
+        self._cond = threading.Condition()
+        self._pending = []          # (seq, line, queued_at)
+        self._pending_snapshot = None
+        self._flush_requested = False
+        self._closed = False
+        self._seq = 0
+        self._durable_seq = 0
+        self._events_since_snapshot = 0
+        self._segment = None
+        self._thread = None
+
+        self._latencies = deque(maxlen=4096)
+        self.batches = 0
+        self.events_written = 0
+        self.snapshots_written = 0
+        self.restore_stats = {}
+
+    # ─── Startup ──────────────────────────────────────────────────────
+
+    def _segments(self):
+        names = [n for n in os.listdir(self.directory)
+                 if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX)]
+        return sorted(names, key=_segment_start)
+
+    def restore(self):
+        """
+        Read the latest snapshot and the events after it. Returns
+        (snapshot_doc or None, tail_events). A torn last line from a crash
+        mid-write is ignored and cut off. Starts the background writer.
+        """
+        started = time.perf_counter()
+        snapshot_seq, doc = 0, None
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_NAME)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            snapshot_seq, doc = snapshot["seq"], snapshot["doc"]
+
+        events = []
+        last_seq = snapshot_seq
+        for name in self._segments():
+            with open(os.path.join(self.directory, name), "rb+") as f:
+                good = 0
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated line")
+                        event = json.loads(line)
+                    except ValueError:
+                        # Cut the torn tail off, so a segment reopened for
+                        # appending never glues a new event onto it
+                        f.truncate(good)
+                        break
+                    good += len(line)
+                    if event["seq"] > snapshot_seq:
+                        events.append(event)
+                        last_seq = max(last_seq, event["seq"])
+
+        self._seq = self._durable_seq = last_seq
+        self._events_since_snapshot = len(events)
+        self.restore_stats = {
+            "snapshot_seq": snapshot_seq,
+            "replayed_events": len(events),
+            "read_seconds": round(time.perf_counter() - started, 6),
+        }
+
+        # Continue in the segment named after the next seq; it is new or empty
+        self._open_segment(last_seq + 1)
+        self._thread = threading.Thread(target=self._run, name="earnings-log", daemon=True)
+        self._thread.start()
+        return doc, events
+
+    def _open_segment(self, first_seq):
+        if self._segment is not None:
+            self._segment.close()
+        self._segment = open(os.path.join(self.directory, _segment_name(first_seq)), "a", encoding="utf-8")
+        _fsync_dir(self.directory)
+
+    # ─── Writing ──────────────────────────────────────────────────────
+
+    def append(self, event):
+        """Queue an event (a JSON-serialisable dict); returns its sequence number."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Earnings event log is closed")
+            self._seq += 1
+            seq = self._seq
+            line = json.dumps({"seq": seq, **event}, separators=(",", ":")) + "\n"
+            self._pending.append((seq, line, time.perf_counter()))
+            self._events_since_snapshot += 1
+            self._cond.notify_all()
+        return seq
+
+    def wait_durable(self, seq):
+        """Block until the event with this sequence number is on disk."""
+        with self._cond:
+            while self._durable_seq < seq and not self._closed:
+                self._cond.wait()
+
+    def snapshot_due(self):
+        return self._events_since_snapshot >= self.snapshot_every
+
+    def snapshot(self, doc):
+        """Schedule a compacted snapshot of doc, which must reflect every event appended so far."""
+        payload = json.dumps({"seq": self._seq, "doc": doc}, separators=(",", ":"))
+        with self._cond:
+            self._pending_snapshot = (self._seq, payload)
+            self._events_since_snapshot = 0
+            self._cond.notify_all()
+
+    def sync(self):
+        """Block until everything appended so far is on disk."""
+        with self._cond:
+            target = self._seq
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._durable_seq < target and self._thread is not None and self._thread.is_alive():
+                self._cond.wait(0.1)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and self._pending_snapshot is None and not self._closed:
+                    self._cond.wait()
+                # Group window: let concurrent writers join this fsync
+                deadline = time.perf_counter() + self.fsync_interval
+                while not self._closed and not self._flush_requested:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, []
+                snapshot, self._pending_snapshot = self._pending_snapshot, None
+                self._flush_requested = False
+                done = self._closed
+
+            if batch:
+                self._segment.write("".join(line for _, line, _ in batch))
+                self._segment.flush()
+                os.fsync(self._segment.fileno())
+                finished = time.perf_counter()
+                with self._cond:
+                    self._durable_seq = batch[-1][0]
+                    self.batches += 1
+                    self.events_written += len(batch)
+                    self._latencies.extend(finished - queued for _, _, queued in batch)
+                    self._cond.notify_all()
+
+            if snapshot:
+                self._write_snapshot(*snapshot)
+
+            if done:
+                return
+
+    def _write_snapshot(self, seq, payload):
+        path = os.path.join(self.directory, SNAPSHOT_NAME)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        _fsync_dir(self.directory)
+        self.snapshots_written += 1
+
+        # New events go to a fresh segment; older segments wholly covered by
+        # the snapshot are no longer needed
+        self._open_segment(self._durable_seq + 1)
+        segments = self._segments()
+        for name, following in zip(segments, segments[1:]):
+            if _segment_start(following) <= seq + 1:
+                os.remove(os.path.join(self.directory, name))
+
+    # ─── Metrics ──────────────────────────────────────────────────────
+
+    def stats(self):
+        with self._cond:
+            latencies = sorted(self._latencies)
+            stats = {
+                "directory": self.directory,
+                "last_seq": self._seq,
+                "durable_seq": self._durable_seq,
+                "events_written": self.events_written,
+                "batches": self.batches,
+                "avg_batch_size": round(self.events_written / self.batches, 2) if self.batches else 0,
+                "snapshots_written": self.snapshots_written,
+                "events_since_snapshot": self._events_since_snapshot,
+                "restore": dict(self.restore_stats),
+            }
+        if latencies:
+            stats["write_latency_ms"] = {
+                "p50": round(latencies[len(latencies) // 2] * 1000, 3),
+                "p99": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+                "max": round(latencies[-1] * 1000, 3),
+                "samples": len(latencies),
+            }
+        return stats
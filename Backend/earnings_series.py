@@ -0,0 +1,123 @@
+"""
+Fixed-size time series for the earnings store.
+
+A RingSeries keeps one slot per period (a month or a day) in a ring of
+`capacity` slots indexed by period ordinal, so writing the current period
+is O(1) and old periods fall out as the ring wraps. Each slot holds the
+amount and a per-platform breakdown. Slots are replaced rather than
+modified and live in a PagedList, so copy() shares every page and a write
+copies only the page it lands in, which the store's copy-on-write
+snapshots rely on.
+"""
+
+from datetime import date, datetime
+
+from paged_collections import PagedList
+
+SLOT_PAGE = 32
+
+
+def month_ordinal(period):
+    """'2025-02' -> months since year 0."""
+    year, month = period.split("-")[:2]
+    return int(year) * 12 + int(month) - 1
+
+
+def month_period(ordinal):
+    return f"{ordinal // 12:04d}-{ordinal % 12 + 1:02d}"
+
+
+def month_label(ordinal):
+    """Three-letter month name, as the dashboard has always shown it."""
+    return date(ordinal // 12, ordinal % 12 + 1, 1).strftime("%b")
+
+
+def day_ordinal(period):
+    return date.fromisoformat(period[:10]).toordinal()
+
+
+def day_period(ordinal):
+    return date.fromordinal(ordinal).isoformat()
+
+
+def current_month():
+    return datetime.now().strftime("%Y-%m")
+
+
+class RingSeries:
+    """Ring buffer of (ordinal, amount, platforms) slots; `head` is the newest ordinal written."""
+
+    __slots__ = ("capacity", "slots", "head")
+
+    def __init__(self, capacity, slots=None, head=None):
+        self.capacity = capacity
+        self.slots = slots if slots is not None else PagedList([None] * capacity, SLOT_PAGE)
+        self.head = head
+
+    def copy(self):
+        return RingSeries(self.capacity, self.slots.copy(), self.head)
+
+    def _slot(self, ordinal):
+        """Slot holding ordinal, or None if it was never written or has been overwritten."""
+        slot = self.slots[ordinal % self.capacity]
+        return slot if slot is not None and slot[0] == ordinal else None
+
+    def _writable(self, ordinal):
+        # Periods older than the ring's window are dropped, not written over newer data
+        return self.head is None or ordinal > self.head - self.capacity
+
+    def _store(self, ordinal, amount, platforms):
+        self.slots[ordinal % self.capacity] = (ordinal, amount, platforms)
+        if self.head is None or ordinal > self.head:
+            self.head = ordinal
+
+    def set(self, ordinal, amount, platforms=None):
+        """Replace the value for a period."""
+        if self._writable(ordinal):
+            self._store(ordinal, amount, dict(platforms or {}))
+
+    def add(self, ordinal, amount, platform=None):
+        """Add to the value for a period (and to one platform's share)."""
+        if not self._writable(ordinal):
+            return
+        slot = self._slot(ordinal)
+        total, platforms = (slot[1], dict(slot[2])) if slot else (0, {})
+        if platform is not None:
+            platforms[platform] = platforms.get(platform, 0) + amount
+        self._store(ordinal, total + amount, platforms)
+
+    def get(self, ordinal):
+        slot = self._slot(ordinal)
+        return None if slot is None else (slot[1], slot[2])
+
+    def range(self, start, end):
+        """Recorded (ordinal, amount, platforms) with start <= ordinal <= end, oldest first."""
+        if self.head is None:
+            return []
+        start = max(start, self.head - self.capacity + 1)
+        end = min(end, self.head)
+        points = []
+        for ordinal in range(start, end + 1):
+            slot = self._slot(ordinal)
+            if slot is not None:
+                points.append(slot)
+        return points
+
+    def latest(self, n):
+        """The n most recent recorded periods, oldest first."""
+        if self.head is None:
+            return []
+        return self.range(self.head - self.capacity + 1, self.head)[-n:]
+
+    def to_json(self):
+        return {
+            "capacity": self.capacity,
+            "points": [[o, a, p] for o, a, p in self.range(-(1 << 62), 1 << 62)],
+        }
+
+    @classmethod
+    def from_json(cls, data, capacity=None):
+        series = cls(capacity or data["capacity"])
+        for ordinal, amount, platforms in data["points"]:
+            series.set(ordinal, amount, platforms)
+        return series
@@ -0,0 +1,549 @@
+import math
+import os
+import secrets
+import threading
+import time
+from datetime import datetime
+
+from earnings_series import (RingSeries, current_month, day_ordinal, day_period,
+                             month_label, month_ordinal, month_period)
+from paged_collections import PagedDict, PagedList
+from state_backend import MemoryBackend
+
+EARNINGS_STORE_DEBUG = os.getenv("EARNINGS_STORE_DEBUG", "").lower() in ("1", "true", "yes")
+
+MONTHLY_CAPACITY = 36    # months kept in the monthly ring
+DAILY_CAPACITY = 400     # days kept in the daily ring
+DASHBOARD_MONTHS = 6     # months shown as monthly_earnings
+CHANGE_WINDOW = 256      # commits whose changed source ids are kept for delta sync
+
+
+def _day_of(source, at=None):
+    """Day ordinal an amount is booked on: the event time, else the source's upload time, else today."""
+    stamp = at or source.get("upload_time")
+    if isinstance(stamp, str) and len(stamp) >= 10:
+        try:
+            return day_ordinal(stamp)
+        except ValueError:
+            pass
+    return datetime.now().toordinal()
+
+
+def _month_key(day):
+    """YYYY-MM bucket for a day ordinal from _day_of."""
+    return day_period(day)[:7]
+
+
+class EarningsSnapshot:
+    """
+    One consistent version of the earnings data: income sources, a name ->
+    position index, running totals (overall, per source channel, per
+    platform and per month the amount was booked in) and two RingSeries: monthly totals
+    (recorded by update_monthly_earnings, keyed YYYY-MM) and daily income
+    added (keyed by date), both with a per-platform breakdown.
+
+    Published snapshots are never modified. A write takes a copy-on-write
+    draft of the current one (the source list, indexes, totals and rings
+    are paged, see paged_collections, so only the pages it changes are
+    copied, plus each source it changes), applies its events to the draft
+    and publishes that, so a reader holding a snapshot keeps a stable view
+    without taking any lock.
+
+    Every source carries a numeric id that is never reused. `changes` lists
+    [version, changed ids, removed ids] for the last CHANGE_WINDOW commits
+    that touched a source; `changes_since` is the oldest version delta()
+    can answer from.
+    """
+
+    __slots__ = ("version", "income_sources", "monthly", "daily", "total_monthly_income",
+                 "total", "by_source", "by_platform", "by_month", "next_id", "changes",
+                 "changes_since", "_positions", "_ids", "_touched", "_removed", "_monthly_view")
+
+    def __init__(self, doc, version=None):
+        self.version = version
+        self.income_sources = PagedList(doc["income_sources"])
+        self.total_monthly_income = doc["total_monthly_income"]
+        self.total = 0
+        self.by_source = PagedDict(default=float)
+        self.by_platform = PagedDict(default=float)
+        self.by_month = PagedDict(default=float)
+        self.next_id = doc.get("next_source_id", 1)
+        self.changes = doc.get("changes", [])
+        self.changes_since = doc.get("changes_since")
+        self._positions = PagedDict()
+        self._ids = PagedDict()
+        self._touched = set()
+        self._removed = set()
+        self._monthly_view = None
+        for i, source in enumerate(self.income_sources):
+            if "id" not in source:
+                # Seed data and documents written before sources had ids
+                source = self.income_sources[i] = {**source, "id": self.next_id}
+            self.next_id = max(self.next_id, source["id"] + 1)
+            self._positions.setdefault(source["name"], i)
+            self._ids[source["id"]] = i
+            self._count(source, source.get("amount", 0), _day_of(source))
+        if "month_totals" in doc:
+            # Credits are booked in the month they arrived, which the sources alone do not record
+            self.by_month = PagedDict(doc["month_totals"], default=float)
+
+        if "monthly_series" in doc:
+            self.monthly = RingSeries.from_json(doc["monthly_series"], MONTHLY_CAPACITY)
+            self.daily = RingSeries.from_json(doc["daily_series"], DAILY_CAPACITY)
+        else:
+            # Seed data and documents written before the time series existed
+            self.monthly = RingSeries(MONTHLY_CAPACITY)
+            entries = doc.get("monthly_earnings", [])
+            fallback = month_ordinal(current_month()) - len(entries) + 1
+            for i, entry in enumerate(entries):
+                period = entry.get("period")
+                self.monthly.set(month_ordinal(period) if period else fallback + i, entry["amount"])
+            self.daily = RingSeries(DAILY_CAPACITY)
+            for source in self.income_sources:
+                self.daily.add(_day_of(source), source.get("amount", 0), source["name"])
+
+    @staticmethod
+    def empty_doc():
+        return {"income_sources": [], "monthly_earnings": [], "total_monthly_income": 0}
+
+    def doc(self):
+        return {
+            "income_sources": list(self.income_sources),
+            "monthly_series": self.monthly.to_json(),
+            "daily_series": self.daily.to_json(),
+            "total_monthly_income": self.total_monthly_income,
+            "month_totals": dict(self.by_month),
+            "next_source_id": self.next_id,
+            "changes": self.changes,
+            "changes_since": self.changes_since,
+        }
+
+    @property
+    def monthly_earnings(self):
+        """Latest recorded months as the dashboard's [{month, period, amount}] list."""
+        if self._monthly_view is None:
+            self._monthly_view = [
+                {"month": month_label(o), "period": month_period(o), "amount": amount}
+                for o, amount, _ in self.monthly.latest(DASHBOARD_MONTHS)
+            ]
+        return self._monthly_view
+
+    def series(self, granularity, start=None, end=None):
+        """
+        Points of the monthly or daily series between start and end
+        (inclusive, YYYY-MM or YYYY-MM-DD; open-ended when omitted).
+        """
+        if granularity == "month":
+            ring, to_ordinal, to_period = self.monthly, month_ordinal, month_period
+        elif granularity == "day":
+            ring, to_ordinal, to_period = self.daily, day_ordinal, day_period
+        else:
+            raise ValueError("granularity must be 'month' or 'day'")
+        lo = to_ordinal(start) if start else -(1 << 62)
+        hi = to_ordinal(end) if end else 1 << 62
+        return [{"period": to_period(o), "amount": amount, "platforms": platforms}
+                for o, amount, platforms in ring.range(lo, hi)]
+
+    def _count(self, source, amount, day):
+        """Add amount to the running totals, booked on day (see _day_of)."""
+        self.total += amount
+        self.by_source[source.get("source", "Unknown")] += amount
+        self.by_platform[source["name"]] += amount
+        self.by_month[_month_key(day)] += amount
+
+    def _draft(self):
+        """Unpublished copy for a writer to change."""
+        draft = object.__new__(EarningsSnapshot)
+        draft.version = None
+        draft.income_sources = self.income_sources.copy()
+        draft.monthly = self.monthly.copy()
+        draft.daily = self.daily.copy()
+        draft._monthly_view = None
+        draft.total_monthly_income = self.total_monthly_income
+        draft.total = self.total
+        draft.by_source = self.by_source.copy()
+        draft.by_platform = self.by_platform.copy()
+        draft.by_month = self.by_month.copy()
+        draft.next_id = self.next_id
+        draft.changes = self.changes    # replaced, not modified, by _record_changes
+        draft.changes_since = self.changes_since
+        draft._positions = self._positions.copy()
+        draft._ids = self._ids.copy()
+        draft._touched = set()
+        draft._removed = set()
+        return draft
+
+    def _record_changes(self):
+        """Log the ids this draft touched under its (just assigned) version."""
+        if self._touched or self._removed:
+            # A new list: the one the draft started from belongs to the published snapshot
+            changes = self.changes + [[self.version, sorted(self._touched), sorted(self._removed)]]
+            if len(changes) > CHANGE_WINDOW:
+                self.changes_since = changes[-CHANGE_WINDOW - 1][0]
+                changes = changes[-CHANGE_WINDOW:]
+            self.changes = changes
+        if self.changes_since is None:
+            self.changes_since = self.version
+
+    def delta(self, since):
+        """
+        (changed sources, removed ids) between version since and this
+        snapshot, or None when since falls outside the retained window.
+        """
+        if self.changes_since is None or not self.changes_since <= since <= self.version:
+            return None
+        changed, removed = set(), set()
+        for version, ids, gone in reversed(self.changes):
+            if version <= since:
+                break
+            changed.update(ids)
+            removed.update(gone)
+        sources = [self.income_sources[self._ids[i]] for i in sorted(changed) if i in self._ids]
+        return sources, sorted(i for i in removed if i not in self._ids)
+
+    def _apply(self, event):
+        """The single place earnings change, shared by live writes and log replay. Drafts only."""
+        op = event["op"]
+        if op == "add_source":
+            source = {**event["source"], "id": self.next_id}
+            self.next_id += 1
+            self._positions.setdefault(source["name"], len(self.income_sources))
+            self._ids[source["id"]] = len(self.income_sources)
+            self._touched.add(source["id"])
+            self.income_sources.append(source)
+            day = _day_of(source, event.get("at"))
+            self._count(source, source.get("amount", 0), day)
+            self.daily.add(day, source.get("amount", 0), source["name"])
+            return source
+        if op == "add_to_source":
+            i = self._positions.get(event["name"])
+            if i is None:
+                return self._apply({"op": "add_source", "at": event.get("at"), "source": {
+                    "name": event["name"], "amount": event["amount"], **event["fields"]}})
+            # Copy before changing: older snapshots still reference the original
+            source = dict(self.income_sources[i])
+            source["amount"] += event["amount"]
+            self.income_sources[i] = source
+            self._touched.add(source["id"])
+            day = _day_of(event["fields"], event.get("at"))
+            self._count(source, event["amount"], day)
+            self.daily.add(day, event["amount"], source["name"])
+            return source
+        if op == "clear":
+            # Ids and the change window outlive a clear, so clients can be told what went away
+            removed = self._removed | self._ids.keys()
+            kept = {"next_source_id": self.next_id, "changes": self.changes, "changes_since": self.changes_since}
+            self.__init__({**self.empty_doc(), **kept})
+            self._removed = removed
+            return None
+        if op == "update_monthly":
+            self.total_monthly_income = self.total
+            # Older logged events only carry the month name
+            period = event.get("period") or current_month()
+            self.monthly.set(month_ordinal(period), self.total, self.by_platform)
+            return None
+        if op == "ledger":
+            return None     # applied to the store's TransactionLedgers, not the snapshot
+        raise ValueError(f"Unknown earnings event: {op}")
+
+    def find_source(self, name):
+        i = self._positions.get(name)
+        return None if i is None else self.income_sources[i]
+
+    def verify_totals(self):
+        """
+        Recompute every total and compare with the running values: overall,
+        per channel and per platform from the source list; per month from
+        the daily series, which books each amount on the same day, for the
+        months it still fully covers (and the months must add up to the total).
+        """
+        expected = EarningsSnapshot({**self.doc(), "month_totals": {}})
+        months = {"": self.total}      # the months add up to the total
+        running_months = {"": sum(self.by_month.values())}
+        if self.daily.head is not None:
+            oldest = self.daily.head - self.daily.capacity + 1
+            for day, amount, _ in self.daily.range(oldest, self.daily.head):
+                months[_month_key(day)] = months.get(_month_key(day), 0) + amount
+            for month in (self.by_month.keys() | months.keys()) - {""}:
+                if day_ordinal(f"{month}-01") >= oldest:
+                    months.setdefault(month, 0)
+                    running_months[month] = self.by_month.get(month, 0)
+                else:
+                    months.pop(month, None)
+        checks = [("overall", {"": expected.total}, {"": self.total}),
+                  ("source", expected.by_source, self.by_source),
+                  ("platform", expected.by_platform, self.by_platform),
+                  ("month", months, running_months)]
+        for label, want, running in checks:
+            for key in want.keys() | running.keys():
+                if not math.isclose(want.get(key, 0), running.get(key, 0), rel_tol=1e-9, abs_tol=1e-6):
+                    raise RuntimeError(
+                        f"Earnings store {label} total drifted for {key!r}: "
+                        f"running {running.get(key, 0)}, recomputed {want.get(key, 0)}"
+                    )
+
+
+class EarningsTransaction:
+    """
+    Batch of earnings changes, applied together when the `with` block exits
+    without an exception (and dropped otherwise). Obtain with
+    EarningsStore.transaction(); `results` holds each change's return value
+    after commit.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.events = []
+        self.results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and self.events:
+            self.results = self.store._commit(self.events)
+
+    def _event(self, op, **fields):
+        # Events carry their own time so replaying the log does not depend on the clock
+        self.events.append({"op": op, "at": datetime.now().isoformat(), **fields})
+
+    def add_source(self, source):
+        self._event("add_source", source=source)
+
+    def add_to_source(self, name, amount, **fields):
+        self._event("add_to_source", name=name, amount=amount, fields=fields)
+
+    def clear(self):
+        self._event("clear")
+
+    def update_monthly_earnings(self):
+        now = datetime.now()
+        self._event("update_monthly", month=now.strftime("%b"), period=now.strftime("%Y-%m"))
+
+    def record_ledger(self, user_id, rows):
+        """Append transaction rows (see transaction_ledger.batch_rows) to a user's ledger."""
+        if rows["amounts"]:
+            self._event("ledger", user=user_id, rows=rows)
+
+
+class EarningsStore:
+    """
+    Earnings data: income sources, the monthly history and the current
+    monthly total, persisted in a StateBackend so every worker sees the same
+    numbers.
+
+    The backend holds one JSON document plus a version counter. Each process
+    keeps the matching EarningsSnapshot and rebuilds it only when another
+    worker has bumped the version, so reads are O(1) and never walk the
+    source list.
+
+    Readers take snapshot() once per request and never block. Writers group
+    changes in transaction(); the batch is applied to a copy of the latest
+    snapshot under the store's write lock (and the backend's namespace
+    lock), then published in a single reference swap, so a reader sees
+    either all of a batch or none of it. The single-change methods below are
+    one-event transactions.
+
+    When an EarningsEventLog is attached, each committed event is also
+    appended to it, and on start-up the store is rebuilt from the log's
+    snapshot plus tail instead of the seed data.
+
+    With TransactionLedgers attached, a transaction's record_ledger() rows
+    are applied to them after the commit is published (and a clear clears
+    them), and the log carries and replays them with the earnings, so range
+    queries and totals come back together after a restart.
+
+    Every commit bumps the version by one. etag() pairs it with an epoch
+    drawn when the backend was first seeded, so a version number reused
+    after an in-memory restart never matches a tag handed out before it.
+
+    With debug=True (or EARNINGS_STORE_DEBUG=1) each commit re-sums the
+    sources and raises RuntimeError if a running total has drifted.
+    """
+
+    NAMESPACE = "earnings"
+
+    def __init__(self, backend=None, income_sources=None, monthly_earnings=None, debug=None, event_log=None,
+                 ledgers=None):
+        self.debug = EARNINGS_STORE_DEBUG if debug is None else debug
+        self.backend = backend or MemoryBackend()
+        self.event_log = event_log
+        self.ledgers = ledgers
+        self._write_lock = threading.Lock()
+        self._snapshot = EarningsSnapshot(EarningsSnapshot.empty_doc())
+        with self._write_lock, self.backend.lock(self.NAMESPACE):
+            self.epoch = self.backend.get(self.NAMESPACE, "epoch")
+            if self.epoch is None:
+                self.epoch = secrets.token_hex(4)
+                self.backend.set(self.NAMESPACE, "epoch", self.epoch)
+            if event_log is not None and self._restore(event_log):
+                return
+            if self.backend.get(self.NAMESPACE, "state") is None:
+                # First worker to start seeds the shared store
+                doc = EarningsSnapshot.empty_doc()
+                doc["income_sources"] = [dict(s) for s in income_sources or []]
+                doc["monthly_earnings"] = [dict(entry) for entry in monthly_earnings or []]
+                doc["total_monthly_income"] = sum(s.get("amount", 0) for s in doc["income_sources"])
+                self._publish(EarningsSnapshot(doc))
+                if event_log is not None:
+                    event_log.snapshot(self._log_doc())
+
+    def _restore(self, event_log):
+        """Rebuild the store from the log's snapshot and tail. Returns False if the log is empty."""
+        started = time.perf_counter()
+        doc, events = event_log.restore()
+        if doc is None and not events:
+            return False
+        doc = doc or EarningsSnapshot.empty_doc()
+        draft = EarningsSnapshot(doc)
+        if self.ledgers is not None:
+            self.ledgers.load(doc.get("ledgers", {}))
+        for event in events:
+            draft._apply(event)
+            self._apply_ledger(event)
+        # Versions restart with this process, so the old change window means nothing now
+        draft.changes, draft.changes_since = [], None
+        self._publish(draft)
+        event_log.restore_stats["total_seconds"] = round(time.perf_counter() - started, 6)
+        return True
+
+    def snapshot(self):
+        """Latest published snapshot, reloaded when another worker bumped the version."""
+        snap = self._snapshot
+        version = self.backend.get(self.NAMESPACE, "version", 0)
+        if version != snap.version:
+            state = self.backend.get(self.NAMESPACE, "state") or EarningsSnapshot.empty_doc()
+            snap = state if isinstance(state, EarningsSnapshot) else EarningsSnapshot(state, version)
+            self._snapshot = snap
+        return snap
+
+    def version_token(self, snap=None):
+        """'<epoch>-<version>' for a snapshot (the latest one by default)."""
+        snap = snap or self.snapshot()
+        return f"{self.epoch}-{snap.version}"
+
+    def etag(self, snap=None):
+        """Strong HTTP entity tag for a snapshot (the latest one by default)."""
+        return f'"{self.version_token(snap)}"'
+
+    def delta(self, token, snap=None):
+        """
+        Sources changed and ids removed since a version_token(), or None if
+        the token is from another epoch or older than the change window.
+        """
+        snap = snap or self.snapshot()
+        epoch, _, version = (token or "").rpartition("-")
+        if epoch != self.epoch or not version.isdigit():
+            return None
+        return snap.delta(int(version))
+
+    def _publish(self, draft):
+        """Persist a draft, then make it the snapshot readers see. Caller holds the locks."""
+        if self.debug:
+            draft.verify_totals()
+        draft.version = self.backend.get(self.NAMESPACE, "version", 0) + 1
+        draft._record_changes()
+        # The memory backend can hold the snapshot itself; others need the JSON document
+        self.backend.set(self.NAMESPACE, "state", draft if self.backend.name == "memory" else draft.doc())
+        self.backend.set(self.NAMESPACE, "version", draft.version)
+        self._snapshot = draft
+
+    def _apply_ledger(self, event):
+        """Mirror a committed event onto the attached ledgers, if any."""
+        if self.ledgers is None:
+            return
+        if event["op"] == "ledger":
+            self.ledgers.record(event["user"], event["rows"])
+        elif event["op"] == "clear":
+            self.ledgers.clear()
+
+    def _log_doc(self):
+        """Document for an event log snapshot: the earnings plus the ledgers they go with."""
+        doc = self._snapshot.doc()
+        if self.ledgers is not None:
+            doc["ledgers"] = self.ledgers.dump()
+        return doc
+
+    def transaction(self):
+        return EarningsTransaction(self)
+
+    def _commit(self, events):
+        seq = None
+        with self._write_lock, self.backend.lock(self.NAMESPACE):
+            draft = self.snapshot()._draft()
+            results = [draft._apply(event) for event in events]
+            if self.event_log is not None:
+                for event in events:
+                    seq = self.event_log.append(event)
+            self._publish(draft)
+            for event in events:
+                self._apply_ledger(event)
+            if self.event_log is not None and self.event_log.snapshot_due():
+                self.event_log.snapshot(self._log_doc())
+        # Wait outside the locks, so concurrent commits share one fsync
+        if seq is not None and self.event_log.sync_writes:
+            self.event_log.wait_durable(seq)
+        return results
+
+    # ─── Single-change writes ──────────────────────────────────────────
+
+    def add_source(self, source):
+        """Append a new income source. Sources may share a name; lookups return the first."""
+        with self.transaction() as txn:
+            txn.add_source(source)
+        return txn.results[0]
+
+    def add_to_source(self, name, amount, **fields):
+        """Add amount to the source called name, creating it from fields if it does not exist."""
+        with self.transaction() as txn:
+            txn.add_to_source(name, amount, **fields)
+        return txn.results[0]
+
+    def clear(self):
+        """Remove all sources and history."""
+        with self.transaction() as txn:
+            txn.clear()
+
+    def update_monthly_earnings(self):
+        """Update the monthly earnings history based on current income sources"""
+        with self.transaction() as txn:
+            txn.update_monthly_earnings()
+
+    # ─── Reads (each from the latest snapshot) ─────────────────────────
+
+    @property
+    def income_sources(self):
+        return self.snapshot().income_sources
+
+    @property
+    def monthly_earnings(self):
+        return self.snapshot().monthly_earnings
+
+    @property
+    def total_monthly_income(self):
+        return self.snapshot().total_monthly_income
+
+    def find_source(self, name):
+        return self.snapshot().find_source(name)
+
+    def series(self, granularity, start=None, end=None):
+        return self.snapshot().series(granularity, start, end)
+
+    def get_total_monthly_income(self):
+        """Total monthly income from all sources"""
+        return self.snapshot().total
+
+    def source_totals(self):
+        """Income per source channel (e.g. SMS, Manual, Zomato)."""
+        return dict(self.snapshot().by_source)
+
+    def platform_totals(self):
+        """Income per platform / source name."""
+        return dict(self.snapshot().by_platform)
+
+    def month_totals(self):
+        """Income per month it was booked in, keyed YYYY-MM."""
+        return dict(self.snapshot().by_month)
+
+    def verify_totals(self):
+        self.snapshot().verify_totals()
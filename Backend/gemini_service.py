@@ -1,12 +1,15 @@
 try:
     import google.generativeai as genai
+    from google.generativeai import client as genai_client
 except ImportError:
     genai = None
 
+import asyncio
+import copy
 import os
-import time
 import json
 import re
+import threading
 from datetime import datetime, timedelta
 from typing import List, Dict
 
@@ -14,68 +17,135 @@ from typing import List, Dict
 from dotenv import load_dotenv
 load_dotenv()
 
+from ai_cache import ResponseCache, cache_key, mask_message, unmask
+from ai_executor import AIExecutor
+from key_pool import KeyPool, parse_keys
+
 _gemini_api_key = os.getenv("GEMINI_API_KEY", "")
 if not _gemini_api_key:
     print("WARNING: GEMINI_API_KEY not set in .env file. AI features will not work.")
 
-API_KEYS = [k.strip() for k in _gemini_api_key.split(",") if k.strip()]
-_current_key_index = 0
+# Every call leases a key from the pool (per-key token bucket sized to
+# AI_KEY_RPM, cooldown after 429s, circuit breaker for dead keys), so
+# throughput grows with the number of keys in GEMINI_API_KEY.
+key_pool = KeyPool(
+    parse_keys(_gemini_api_key, float(os.getenv("AI_KEY_RPM", "15"))),
+    burst=float(os.getenv("AI_KEY_BURST", "5")),
+    cooldown_s=float(os.getenv("AI_KEY_COOLDOWN_S", "30")),
+    circuit_s=float(os.getenv("AI_KEY_CIRCUIT_S", "300")),
+    max_wait_s=float(os.getenv("AI_KEY_MAX_WAIT_S", "30")),
+)
+API_KEYS = [state.key for state in key_pool.keys]
+
+# Gemini calls from async endpoints run on this pool, at most
+# AI_MAX_CONCURRENCY at a time.
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+ai_executor = AIExecutor(AI_MAX_CONCURRENCY)
+
+# Answers to repeated messages and identical earnings histories are served
+# from here (decode_financial_message, predict_income_risk, analyze_earning_trend)
+ai_cache = ResponseCache(
+    max_entries=int(os.getenv("AI_CACHE_MAX_ENTRIES", "2048")),
+    max_bytes=int(float(os.getenv("AI_CACHE_MAX_MB", "16")) * 1024 * 1024),
+    ttl_s=float(os.getenv("AI_CACHE_TTL_S", "86400")),
+)
 
-def configure_gemini(model_name='gemini-2.5-flash'):
-    """Configure Gemini API with automatic key rotation on quota errors."""
-    global _current_key_index
+# Models and their service clients are built once per (model name, key) and
+# shared across requests and threads; a key's entries are dropped when the
+# key pool retires it. GenerativeModel has no per-client argument, so this
+# binds model._client through genai's client manager; requirements.txt pins
+# google-generativeai to the version these internals were checked against.
+_models = {}
+_clients = {}
+_models_lock = threading.Lock()
+
+def _client_for(api_key):
+    """One generative service client per API key. Caller holds _models_lock."""
+    client = _clients.get(api_key)
+    if client is None:
+        manager = genai_client._ClientManager()
+        manager.configure(api_key=api_key)
+        client = _clients[api_key] = manager.make_client("generative")
+    return client
+
+def configure_gemini(api_key, model_name='gemini-2.5-flash'):
+    """The cached GenerativeModel for a key, bound to it without touching genai's global configuration."""
+    model = _models.get((model_name, api_key))
+    if model is not None:
+        return model
     if genai is None:
         raise ImportError("Google Generative AI module not found. Install google-generativeai")
-    genai.configure(api_key=API_KEYS[_current_key_index % len(API_KEYS)])
-    return genai.GenerativeModel(model_name)
+    with _models_lock:
+        model = _models.get((model_name, api_key))
+        if model is None:
+            model = genai.GenerativeModel(model_name)
+            model._client = _client_for(api_key)
+            _models[(model_name, api_key)] = model
+        return model
+
+def retire_key(api_key):
+    """Forget the models and client built for a key (called when its circuit opens)."""
+    with _models_lock:
+        for entry in [k for k in _models if k[1] == api_key]:
+            del _models[entry]
+        _clients.pop(api_key, None)
 
-def _rotate_key_and_retry(func, *args, max_retries=2, **kwargs):
-    """Retry a Gemini call with the next API key on 429 errors."""
-    global _current_key_index
+key_pool.on_retire.append(retire_key)
+
+async def _agenerate(content, model_name='gemini-2.5-flash', max_retries=2):
+    """
+    Async model.generate_content on a leased key. The call runs on the AI
+    thread pool; waiting for a free key uses asyncio.sleep. A quota or
+    auth error is retried on another key.
+    """
     last_err = None
     for attempt in range(max_retries + 1):
+        lease = await key_pool.acquire_async()
         try:
-            return func(*args, **kwargs)
+            model = configure_gemini(lease.key, model_name)
+            response = await ai_executor.run(model.generate_content, content)
         except Exception as e:
-            last_err = e
-            err_str = str(e)
-            if "429" in err_str or "quota" in err_str.lower() or "Resource has been exhausted" in err_str:
-                _current_key_index = (_current_key_index + 1) % len(API_KEYS)
-                genai.configure(api_key=API_KEYS[_current_key_index])
-                time.sleep(1)
-            else:
+            if not key_pool.release(lease, e):
                 raise
+            last_err = e
+            ai_executor.record_retry()
+            continue
+        else:
+            key_pool.release(lease)
+            return response
+        finally:
+            # Cancelled: give the key back without judging it
+            key_pool.abandon(lease)
     raise last_err
 
-def _generate_with_retry(model, content, max_retries=2):
-    """Call model.generate_content with automatic key rotation on quota errors."""
-    global _current_key_index
+def _generate(content, model_name='gemini-2.5-flash', max_retries=2):
+    """Blocking variant of _agenerate for synchronous callers (run them off the event loop)."""
     last_err = None
     for attempt in range(max_retries + 1):
+        lease = key_pool.acquire()
         try:
-            if isinstance(content, list):
-                return model.generate_content(content)
-            else:
-                return model.generate_content(content)
+            response = configure_gemini(lease.key, model_name).generate_content(content)
         except Exception as e:
-            last_err = e
-            err_str = str(e)
-            if "429" in err_str or "quota" in err_str.lower() or "Resource has been exhausted" in err_str:
-                _current_key_index = (_current_key_index + 1) % len(API_KEYS)
-                genai.configure(api_key=API_KEYS[_current_key_index])
-                model = configure_gemini()
-                time.sleep(1)
-            else:
+            if not key_pool.release(lease, e):
                 raise
+            last_err = e
+            continue
+        else:
+            key_pool.release(lease)
+            return response
+        finally:
+            key_pool.abandon(lease)
     raise last_err
 
 def analyze_earning_trend(earnings_data):
     """
     Uses Google Gemini to analyze earning trends and provide advice.
     """
+    key = cache_key("trend", json.dumps(earnings_data, sort_keys=True, default=str))
+    cached = ai_cache.get(key)
+    if cached is not None:
+        return cached
     try:
-        model = configure_gemini()
-        
         prompt = f"""
         You are a financial advisor for a gig worker in India.
         Here is their monthly earnings data: {earnings_data}
@@ -86,58 +156,116 @@ def analyze_earning_trend(earnings_data):
         3. Keep it encouraging and under 50 words.
         """
 
-        response = _generate_with_retry(model, prompt)
+        response = _generate(prompt)
+        ai_cache.set(key, response.text)
         return response.text
     except Exception as e:
         return f"AI Analysis currently unavailable: {str(e)}"
 
+# Bulk AI SMS parsing packs many messages into one prompt. A chunk is
+# closed once its estimated input tokens (about 4 characters per token)
+# reach AI_SMS_BATCH_TOKENS or it holds AI_SMS_BATCH_MAX messages.
+AI_SMS_BATCH_TOKENS = int(os.getenv("AI_SMS_BATCH_TOKENS", "4000"))
+AI_SMS_BATCH_MAX = int(os.getenv("AI_SMS_BATCH_MAX", "50"))
+AI_SMS_BATCH_RETRIES = int(os.getenv("AI_SMS_BATCH_RETRIES", "1"))
+_SMS_ITEM_OVERHEAD_TOKENS = 40   # index, separators and the item's share of the reply
+
+_SMS_BATCH_PROMPT = """
+Analyze each numbered SMS message below and extract financial transaction information.
+
+{items}
+
+Return a JSON array with one object per message, in any order, each with these fields:
+- index: the message number in square brackets
+- amount: numeric value (0 if no amount found)
+- merchant: name of platform/merchant (Swiggy, Zomato, Uber, etc., or "Unknown")
+- type: "credit" or "debit" or "unknown"
+- date: date if mentioned, else null
+- description: brief summary
+
+Only return the JSON array, no markdown formatting.
+"""
+
+def _estimate_tokens(text):
+    return len(text) // 4 + 1
+
+def _chunk_sms(indexed):
+    """Split (index, message) pairs into chunks that fit the batch token budget."""
+    chunks, chunk, budget = [], [], 0
+    for index, msg in indexed:
+        cost = _estimate_tokens(msg) + _SMS_ITEM_OVERHEAD_TOKENS
+        if chunk and (budget + cost > AI_SMS_BATCH_TOKENS or len(chunk) >= AI_SMS_BATCH_MAX):
+            chunks.append(chunk)
+            chunk, budget = [], 0
+        chunk.append((index, msg))
+        budget += cost
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+async def _parse_sms_chunk(chunk):
+    """One prompt for a chunk of (index, message); returns {index: parsed} for the items that parsed."""
+    items = "\n".join(f"[{index}] {msg}" for index, msg in chunk)
+    response = await _agenerate(_SMS_BATCH_PROMPT.format(items=items))
+    text = response.text.replace('```json', '').replace('```', '').strip()
+    try:
+        reply = json.loads(text)
+    except json.JSONDecodeError:
+        return {}
+    wanted = {index for index, _ in chunk}
+    parsed = {}
+    for item in reply if isinstance(reply, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.pop("index"))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if index in wanted and "amount" in item:
+            parsed[index] = item
+    return parsed
+
 async def parse_sms_with_ai(messages: List[str]) -> List[Dict]:
     """
     AI-based SMS parsing using NLP instead of regex.
     Extracts earnings information from SMS messages.
+
+    Messages are sent many to a prompt, in chunks sized to a token budget
+    and requested concurrently. Items missing from a reply (or whose chunk
+    failed) are retried in fresh chunks up to AI_SMS_BATCH_RETRIES times.
     """
-    try:
-        model = configure_gemini()
-        
-        # Batch process messages
-        results = []
-        for msg in messages:
-            prompt = f"""
-            Analyze this SMS message and extract financial transaction information.
-            SMS: {msg}
-            
-            Return a JSON object with these fields:
-            - amount: numeric value (0 if no amount found)
-            - merchant: name of platform/merchant (Swiggy, Zomato, Uber, etc., or "Unknown")
-            - type: "credit" or "debit" or "unknown"
-            - date: date if mentioned, else null
-            - description: brief summary
-            
-            Only return the JSON, no markdown formatting.
-            """
-            
-            response = _generate_with_retry(model, prompt)
-            text = response.text.replace('```json', '').replace('```', '').strip()
-            
-            try:
-                parsed = json.loads(text)
-                parsed['raw'] = msg
-                results.append(parsed)
-            except json.JSONDecodeError:
-                # Fallback
-                results.append({
-                    "amount": 0,
-                    "merchant": "Unknown",
-                    "type": "unknown",
-                    "date": None,
-                    "description": "Could not parse",
-                    "raw": msg
-                })
-        
-        return results
-    except Exception as e:
-        # Fallback to simple parsing
-        return [{"amount": 0, "merchant": "Unknown", "type": "unknown", "raw": msg, "error": str(e)} for msg in messages]
+    results = {}
+    errors = {}
+    pending = list(enumerate(messages))
+    for attempt in range(AI_SMS_BATCH_RETRIES + 1):
+        if not pending:
+            break
+        chunks = _chunk_sms(pending)
+        replies = await asyncio.gather(*(_parse_sms_chunk(c) for c in chunks), return_exceptions=True)
+        for chunk, reply in zip(chunks, replies):
+            if isinstance(reply, Exception):
+                errors.update((index, str(reply)) for index, _ in chunk)
+            else:
+                results.update(reply)
+        pending = [(index, msg) for index, msg in pending if index not in results]
+
+    parsed = []
+    for index, msg in enumerate(messages):
+        if index in results:
+            parsed.append({**results[index], "raw": msg})
+        elif index in errors:
+            parsed.append({"amount": 0, "merchant": "Unknown", "type": "unknown", "raw": msg, "error": errors[index]})
+        else:
+            # Fallback
+            parsed.append({
+                "amount": 0,
+                "merchant": "Unknown",
+                "type": "unknown",
+                "date": None,
+                "description": "Could not parse",
+                "raw": msg
+            })
+    return parsed
 
 async def chat_with_ai_assistant(message: str, history: List[Dict]) -> str:
     """
@@ -145,8 +273,6 @@ async def chat_with_ai_assistant(message: str, history: List[Dict]) -> str:
     Can parse SMS, decode messages, recommend schemes, help with taxes, and more.
     """
     try:
-        model = configure_gemini()
-        
         # Build context from history
         context = "\n".join([f"{h['role']}: {h['content']}" for h in history[-10:]])
         
@@ -179,7 +305,7 @@ Previous conversation:
 User: {message}
 """
         
-        response = _generate_with_retry(model, prompt)
+        response = await _agenerate(prompt)
         return response.text
     except Exception as e:
         return f"I'm having trouble connecting right now. Error: {str(e)}"
@@ -188,9 +314,11 @@ async def predict_income_risk(earnings_history: List[Dict]) -> Dict:
     """
     Predicts potential low-earning periods using historical patterns.
     """
+    key = cache_key("risk", json.dumps(earnings_history, sort_keys=True, default=str))
+    cached = ai_cache.get(key)
+    if cached is not None:
+        return copy.deepcopy(cached)
     try:
-        model = configure_gemini()
-        
         prompt = f"""
         Analyze this earnings history for a gig worker: {json.dumps(earnings_history)}
         
@@ -211,11 +339,13 @@ async def predict_income_risk(earnings_history: List[Dict]) -> Dict:
         Only return JSON, no markdown.
         """
         
-        response = _generate_with_retry(model, prompt)
+        response = await _agenerate(prompt)
         text = response.text.replace('```json', '').replace('```', '').strip()
         
         try:
-            return json.loads(text)
+            prediction = json.loads(text)
+            ai_cache.set(key, copy.deepcopy(prediction))
+            return prediction
         except:
             return {
                 "risk_level": "Medium",
@@ -230,19 +360,26 @@ async def predict_income_risk(earnings_history: List[Dict]) -> Dict:
 async def decode_financial_message(message: str) -> str:
     """
     Explains confusing bank/platform messages in simple language.
+    Amounts, account numbers and dates are masked before the message is
+    sent, so the same notice for another user is answered from the cache.
     """
+    masked, values = mask_message(message)
+    key = cache_key("decode", masked)
+    cached = ai_cache.get(key)
+    if cached is not None:
+        return unmask(cached, values)
     try:
-        model = configure_gemini()
-        
         prompt = f"""
-        A gig worker received this message: "{message}"
+        A gig worker received this message: "{masked}"
         
         Explain what it means in simple Hindi-English (Hinglish) that a common person can understand.
+        Placeholders such as <AMOUNT_1>, <ACCOUNT_1> or <DATE_1> stand for real values; keep them unchanged in your explanation.
         Keep it under 50 words.
         """
         
-        response = _generate_with_retry(model, prompt)
-        return response.text
+        response = await _agenerate(prompt)
+        ai_cache.set(key, response.text)
+        return unmask(response.text, values)
     except Exception as e:
         return f"Could not decode: {str(e)}"
 
@@ -253,9 +390,6 @@ def verify_document_with_ai(file_bytes, mime_type, doc_type):
     Uses gemini-1.5-flash which supports both text and image input.
     """
     try:
-        # Use gemini-2.5-flash for vision capabilities
-        model = configure_gemini('gemini-2.5-flash')
-        
         import base64
         
         # Determine if this is an income proof or identity document
@@ -357,8 +491,9 @@ ADDITIONAL CROSS-CHECKS:
             "data": base64.b64encode(file_bytes).decode('utf-8') if isinstance(file_bytes, bytes) else file_bytes
         }
         
-        # Use inline_data dict format compatible with all google-generativeai versions
-        response = _generate_with_retry(model, [prompt, {"inline_data": image_part}])
+        # Use inline_data dict format compatible with all google-generativeai versions;
+        # gemini-2.5-flash handles the image input
+        response = _generate([prompt, {"inline_data": image_part}], 'gemini-2.5-flash')
         
         # Clean response text to ensure JSON
         text = response.text.replace('```json', '').replace('```', '').strip()
@@ -0,0 +1,271 @@
+"""
+Health-aware pool of Gemini API keys.
+
+Each key has its own token bucket sized to its quota (requests per
+minute), so the pool's throughput is the sum over its keys. A call
+acquires a lease on one key, picking the least loaded key that has a
+token; the lease is released with the call's outcome:
+
+- a quota error (429) puts the key in a cooldown that doubles with each
+  consecutive 429 and empties its bucket;
+- an authentication error opens the key's circuit at once, and
+  `failure_threshold` consecutive server or transport errors (5xx,
+  deadline exceeded, connection failures) open it too. An open key is
+  skipped for `circuit_s` seconds, then allows a single trial call
+  (half-open): success closes the circuit, failure opens it again;
+- any other error (a bad request, a bug on our side) says nothing about
+  the key and leaves its health as it was, like abandon().
+
+Keys come from GEMINI_API_KEY as a comma-separated list; `key:rpm`
+overrides the default quota for one key.
+
+Errors are classified by the google-api-core exception type the SDK
+raises; only the SDK's own error reasons are matched in the text.
+"""
+
+import asyncio
+import threading
+import time
+
+try:
+    from google.api_core import exceptions as api_exceptions
+except ImportError:
+    api_exceptions = None
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+if api_exceptions is not None:
+    _QUOTA_TYPES = (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests)
+    _AUTH_TYPES = (api_exceptions.Unauthenticated, api_exceptions.PermissionDenied)
+    # ServerError covers InternalServerError, ServiceUnavailable and DeadlineExceeded
+    _SERVER_TYPES = (api_exceptions.ServerError, api_exceptions.RetryError, ConnectionError, TimeoutError)
+else:
+    _QUOTA_TYPES = _AUTH_TYPES = ()
+    _SERVER_TYPES = (ConnectionError, TimeoutError)
+
+_QUOTA_REASONS = ("RESOURCE_EXHAUSTED", "Resource has been exhausted")
+# A malformed or revoked key comes back as 400 INVALID_ARGUMENT with this reason
+_AUTH_REASONS = ("API_KEY_INVALID", "API key not valid")
+
+
+def is_quota_error(e):
+    return isinstance(e, _QUOTA_TYPES) or any(reason in str(e) for reason in _QUOTA_REASONS)
+
+
+def is_auth_error(e):
+    return isinstance(e, _AUTH_TYPES) or any(reason in str(e) for reason in _AUTH_REASONS)
+
+
+def is_server_error(e):
+    """Server-side or transport failure: counts toward opening the key's circuit."""
+    return isinstance(e, _SERVER_TYPES)
+
+
+def parse_keys(value, default_rpm):
+    """'k1,k2:30' -> [('k1', default_rpm), ('k2', 30)]."""
+    keys = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, rpm = item.partition(":")
+        keys.append((key.strip(), float(rpm) if rpm.strip() else default_rpm))
+    return keys
+
+
+class KeyState:
+    """One API key's bucket, load and circuit state. Guarded by the pool's lock."""
+
+    def __init__(self, key, rpm, burst):
+        self.key = key
+        self.rate = rpm / 60.0
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.cooldown_until = 0.0
+        self.quota_strikes = 0
+        self.failures = 0
+        self.calls = 0
+        self.quota_errors = 0
+        self.errors = 0
+
+    @property
+    def label(self):
+        return "…" + self.key[-4:]
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def usable(self, now):
+        """Whether the circuit and cooldown allow a call now (ignoring tokens)."""
+        if self.state == OPEN:
+            if now < self.open_until:
+                return False
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and self.in_flight:
+            return False                     # one trial call at a time
+        return now >= self.cooldown_until
+
+    def ready_in(self, now):
+        """Seconds until this key could take a call, ignoring other callers."""
+        if self.state == OPEN and now < self.open_until:
+            return self.open_until - now
+        wait = max(0.0, self.cooldown_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate if self.rate else float("inf"))
+        return wait
+
+
+class KeyLease:
+    __slots__ = ("state", "key", "acquired", "released")
+
+    def __init__(self, state):
+        self.state = state
+        self.key = state.key
+        self.acquired = time.monotonic()
+        self.released = False
+
+
+class KeyPool:
+    """Hands out API keys per call; see the module docstring for the policy."""
+
+    def __init__(self, keys, burst=5, cooldown_s=30.0, max_cooldown_s=300.0,
+                 circuit_s=300.0, failure_threshold=5, max_wait_s=30.0):
+        self.keys = [KeyState(key, rpm, burst) for key, rpm in keys]
+        self.cooldown_s = cooldown_s
+        self.max_cooldown_s = max_cooldown_s
+        self.circuit_s = circuit_s
+        self.failure_threshold = failure_threshold
+        self.max_wait_s = max_wait_s
+        self.on_retire = []                  # callbacks(key) run when a key's circuit opens
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _try_acquire(self):
+        """A lease on the least-loaded ready key, or (None, seconds to wait)."""
+        if not self.keys:
+            raise RuntimeError("No Gemini API key configured. Set GEMINI_API_KEY in .env")
+        now = time.monotonic()
+        with self._lock:
+            best = None
+            for state in self.keys:
+                state.refill(now)
+                if state.tokens >= 1 and state.usable(now):
+                    if best is None or (state.in_flight, -state.tokens) < (best.in_flight, -best.tokens):
+                        best = state
+            if best is not None:
+                best.tokens -= 1
+                best.in_flight += 1
+                best.calls += 1
+                return KeyLease(best), 0.0
+            return None, min(state.ready_in(now) for state in self.keys)
+
+    def _deadline_passed(self, started, wait):
+        return time.monotonic() - started + wait > self.max_wait_s
+
+    def acquire(self):
+        """Block until a key is free; raises RuntimeError after max_wait_s."""
+        started = time.monotonic()
+        while True:
+            lease, wait = self._try_acquire()
+            if lease is not None:
+                return lease
+            if self._deadline_passed(started, wait):
+                raise RuntimeError("All Gemini API keys are rate limited or unavailable")
+            time.sleep(max(wait, 0.01))
+
+    async def acquire_async(self):
+        """acquire() that waits with asyncio.sleep."""
+        started = time.monotonic()
+        while True:
+            lease, wait = self._try_acquire()
+            if lease is not None:
+                return lease
+            if self._deadline_passed(started, wait):
+                raise RuntimeError("All Gemini API keys are rate limited or unavailable")
+            await asyncio.sleep(max(wait, 0.01))
+
+    def release(self, lease, error=None):
+        """
+        Return a lease with the call's outcome. Returns True if the error
+        was the key's fault (quota or auth), so the call is worth retrying
+        on another key. An error that is neither the key's fault nor a
+        server or transport failure is handled like abandon().
+        """
+        state = lease.state
+        retired = False
+        now = time.monotonic()
+        with self._lock:
+            if lease.released:
+                return False
+            lease.released = True
+            state.in_flight -= 1
+            if error is None:
+                state.quota_strikes = 0
+                state.failures = 0
+                state.state = CLOSED
+                return False
+            if is_quota_error(error):
+                state.quota_errors += 1
+                state.quota_strikes += 1
+                state.tokens = 0
+                state.cooldown_until = now + min(self.max_cooldown_s,
+                                                 self.cooldown_s * 2 ** (state.quota_strikes - 1))
+                if state.state == HALF_OPEN:
+                    state.state = OPEN
+                    state.open_until = now + self.circuit_s
+                return True
+            key_fault = is_auth_error(error)
+            if not key_fault and not is_server_error(error):
+                return False
+            state.errors += 1
+            state.failures += 1
+            if key_fault or state.failures >= self.failure_threshold or state.state == HALF_OPEN:
+                retired = state.state != OPEN
+                state.state = OPEN
+                state.open_until = now + self.circuit_s
+        if retired:
+            for callback in self.on_retire:
+                callback(state.key)
+        return key_fault
+
+    def abandon(self, lease):
+        """
+        Return a lease whose call ended without an outcome (e.g. cancelled),
+        leaving the key's health as it was. No-op once the lease is released.
+        """
+        with self._lock:
+            if not lease.released:
+                lease.released = True
+                lease.state.in_flight -= 1
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            keys = []
+            for state in self.keys:
+                state.refill(now)
+                keys.append({
+                    "key": state.label,
+                    "state": state.state if state.state != OPEN or now < state.open_until else HALF_OPEN,
+                    "rpm": round(state.rate * 60, 2),
+                    "tokens": round(state.tokens, 2),
+                    "in_flight": state.in_flight,
+                    "calls": state.calls,
+                    "quota_errors": state.quota_errors,
+                    "errors": state.errors,
+                    "cooldown_s": round(max(0.0, state.cooldown_until - now), 2),
+                })
+        return {
+            "keys": keys,
+            "total_rpm": round(sum(k["rpm"] for k in keys), 2),
+            "available": sum(1 for k in keys if k["state"] != OPEN and k["cooldown_s"] == 0),
+        }
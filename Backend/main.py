@@ -1,4 +1,5 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 from dotenv import load_dotenv
@@ -6,10 +7,16 @@ from dotenv import load_dotenv
 # Load .env file if present
 load_dotenv()
 
-from sms_parser import SMSParser
+from sms_parser import SMSParser, create_parse_pool, new_batch_stats
+from sms_dedup import FingerprintIndex, SharedFingerprintIndex
+from earnings_store import EarningsStore
+from earnings_log import EarningsEventLog
+from transaction_ledger import TransactionLedgers, batch_rows, day_of
+from state_backend import create_backend
 from schemes import get_eligible_schemes, SCHEMES_DB, simplify_scheme_explanation
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
+import base64
 import json
 import os
 import secrets
@@ -22,7 +29,10 @@ from gemini_service import (
     chat_with_ai_assistant,
     predict_income_risk,
     decode_financial_message,
-    verify_document_with_ai
+    verify_document_with_ai,
+    ai_executor,
+    ai_cache,
+    key_pool
 )
 
 app = FastAPI(title="ArthikSetu AI Backend")
@@ -36,57 +46,141 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Shared state (earnings, chat, OTPs, watermarks). Use sqlite:// or redis://
+# via STATE_BACKEND so several uvicorn workers see the same data.
+state = create_backend()
+
 parser = SMSParser()
 
-# Store chat history (in production, use a database)
-chat_sessions = {}
+# Batches at or above this size are parsed across the process pool.
+SMS_PARALLEL_THRESHOLD = int(os.getenv("SMS_PARALLEL_THRESHOLD", "5000"))
+SMS_PARSER_WORKERS = int(os.getenv("SMS_PARSER_WORKERS", "0")) or None
+# Lines of /api/parse_sms_stream ingested (and committed) together
+SMS_STREAM_CHUNK = int(os.getenv("SMS_STREAM_CHUNK", "500"))
+
+# Started once at app startup and reused across requests
+parse_pool = None
+parse_workers = 1
+
+# Page of income sources /api/dashboard and /api/export_earnings return when
+# no limit is given, and the largest limit they accept
+SOURCES_PAGE_MAX = int(os.getenv("SOURCES_PAGE_MAX", "200"))
+SOURCES_PAGE_DEFAULT = min(int(os.getenv("SOURCES_PAGE_DEFAULT", "50")), SOURCES_PAGE_MAX)
+
+# Fingerprints of SMS already ingested, so re-sent windows are not counted twice.
+# A shared backend keeps them there so all workers agree.
+sms_index = FingerprintIndex() if state.name == "memory" else SharedFingerprintIndex(state)
+
+# Per-user ingestion watermark: the highest message id processed so far.
+# Clients send only newer messages; anything at or below it is dropped.
+ingestion_watermarks = state.namespace("watermarks")
+# Registry last loaded through /api/reload_platforms, so every worker follows it
+published_registry = state.namespace("platform_registry")
+
+def _apply_watermark(user_id: str, messages: List[str], message_ids: Optional[List[int]]):
+    """Drop messages at or below the user's watermark. Returns (messages, ids, stale_count)."""
+    if message_ids is None:
+        return messages, None, 0
+    if len(message_ids) != len(messages):
+        raise HTTPException(status_code=400, detail="message_ids must have one entry per message")
+    watermark = ingestion_watermarks.get(user_id)
+    if watermark is None:
+        return messages, message_ids, 0
+    fresh = [(msg, mid) for msg, mid in zip(messages, message_ids) if mid > watermark]
+    return [msg for msg, _ in fresh], [mid for _, mid in fresh], len(messages) - len(fresh)
+
+def _advance_watermark(user_id: str, highest: Optional[int]):
+    if highest is None:
+        return ingestion_watermarks.get(user_id)
+    return ingestion_watermarks.transform(
+        user_id, lambda current: highest if current is None or highest > current else current
+    )
+
+@app.on_event("startup")
+def start_parse_pool():
+    global parse_pool, parse_workers
+    parse_pool, parse_workers = create_parse_pool(SMS_PARSER_WORKERS)
+
+@app.on_event("shutdown")
+def stop_parse_pool():
+    if parse_pool is not None:
+        parse_pool.shutdown(wait=False, cancel_futures=True)
+
+@app.on_event("shutdown")
+def stop_ai_executor():
+    ai_executor.shutdown()
+
+@app.on_event("shutdown")
+def close_state():
+    if earnings_log is not None:
+        earnings_log.close()
+    state.close()
+
+def _sync_registry():
+    """Pick up a registry reload handled by another worker."""
+    published = published_registry.get("current")
+    if published is not None and published["checksum"] != parser.registry.checksum:
+        parser.reload_registry(published["spec"])
+
+async def parse_messages(messages: List[str], stats: Optional[Dict] = None, keep_raw: bool = False):
+    """
+    Parse into a compact TransactionBatch. Small batches run inline; large
+    ones go to the process pool off the event loop.
+    """
+    await asyncio.to_thread(_sync_registry)
+    if parse_pool is not None and len(messages) >= SMS_PARALLEL_THRESHOLD:
+        return await asyncio.to_thread(parser.parse_batch_parallel, messages, parse_pool, parse_workers, stats, keep_raw)
+    return parser.parse_batch_compact(messages, stats, keep_raw)
+
+# Chat history per session, kept in the shared state backend
+chat_sessions = state.namespace("chat")
 
 # ============================================
 # DYNAMIC IN-MEMORY DATA STORE
 # ============================================
+# Optional append-only log so earnings survive restarts. Shared backends
+# (sqlite://, redis://) persist on their own and are not combined with it.
+EARNINGS_LOG_DIR = os.getenv("EARNINGS_LOG_DIR")
+if EARNINGS_LOG_DIR and state.name != "memory":
+    raise RuntimeError("EARNINGS_LOG_DIR only applies to STATE_BACKEND=memory")
+earnings_log = EarningsEventLog(
+    EARNINGS_LOG_DIR,
+    fsync_interval_ms=float(os.getenv("EARNINGS_LOG_FSYNC_MS", "10")),
+    snapshot_every=int(os.getenv("EARNINGS_SNAPSHOT_EVERY", "1000")),
+    sync_writes=os.getenv("EARNINGS_LOG_SYNC_WRITES", "").lower() in ("1", "true", "yes"),
+) if EARNINGS_LOG_DIR else None
+
+# Individual transactions per user, for date-range aggregation. Rows are
+# recorded through earnings transactions, so they are logged with the credits.
+ledgers = TransactionLedgers(state)
+
 # This stores all earnings data dynamically
-earnings_store = {
-    "income_sources": [
+earnings_store = EarningsStore(
+    state,
+    event_log=earnings_log,
+    ledgers=ledgers,
+    income_sources=[
         {"name": "Zomato", "amount": 14500, "verified": True, "source": "Zomato", "description": "Food delivery earnings - Zomato", "upload_time": "2025-02-01T09:00:00"},
         {"name": "Swiggy", "amount": 11200, "verified": True, "source": "Swiggy", "description": "Food delivery earnings - Swiggy", "upload_time": "2025-02-01T09:05:00"},
         {"name": "Uber", "amount": 8900, "verified": True, "source": "Uber", "description": "Ride-sharing earnings - Uber", "upload_time": "2025-02-01T09:10:00"},
     ],
-    "monthly_earnings": [
-        {"month": "Sep", "amount": 28400},
-        {"month": "Oct", "amount": 31200},
-        {"month": "Nov", "amount": 26800},
-        {"month": "Dec", "amount": 35600},
-        {"month": "Jan", "amount": 30500},
-        {"month": "Feb", "amount": 34600},
+    monthly_earnings=[
+        {"month": "Sep", "period": "2024-09", "amount": 28400},
+        {"month": "Oct", "period": "2024-10", "amount": 31200},
+        {"month": "Nov", "period": "2024-11", "amount": 26800},
+        {"month": "Dec", "period": "2024-12", "amount": 35600},
+        {"month": "Jan", "period": "2025-01", "amount": 30500},
+        {"month": "Feb", "period": "2025-02", "amount": 34600},
     ],
-    "total_monthly_income": 34600,
-}
-
-def get_total_monthly_income():
-    """Calculate total monthly income from all sources"""
-    return sum(s.get("amount", 0) for s in earnings_store["income_sources"])
-
-def update_monthly_earnings():
-    """Update the monthly earnings history based on current income sources"""
-    total = get_total_monthly_income()
-    earnings_store["total_monthly_income"] = total
-    
-    # Update the current month in monthly earnings
-    current_month = datetime.now().strftime("%b")
-    found = False
-    for entry in earnings_store["monthly_earnings"]:
-        if entry["month"] == current_month:
-            entry["amount"] = total
-            found = True
-            break
-    if not found:
-        earnings_store["monthly_earnings"].append({"month": current_month, "amount": total})
-    
-    # Keep only last 6 months
-    earnings_store["monthly_earnings"] = earnings_store["monthly_earnings"][-6:]
+)
 
 class SMSRequest(BaseModel):
     messages: List[str]
+    include_raw: bool = False  # echo the original SMS text back in each transaction
+    user_id: Optional[str] = "default"
+    # Per-message sequence number or timestamp (e.g. Android SMS date in ms),
+    # aligned with messages. Enables the incremental-sync watermark.
+    message_ids: Optional[List[int]] = None
 
 class UserProfile(BaseModel):
     age: int
@@ -98,18 +192,113 @@ class UserProfile(BaseModel):
 def read_root():
     return {"message": "ArthikSetu AI Backend is Running"}
 
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    strip = lambda tag: tag.strip().removeprefix("W/")
+    return any(strip(tag) == strip(etag) for tag in if_none_match.split(","))
+
+def _check_etag(request: Request, response: Response, snap, weak: bool = False):
+    """
+    Tag the response with the earnings version it was built from. Returns a
+    304 response when the client's If-None-Match already names that
+    version, so the endpoint can skip building the body.
+    """
+    etag = earnings_store.etag(snap)
+    if weak:
+        etag = "W/" + etag
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+def _encode_cursor(sources, offset):
+    # Remember the name of the last source served, so a cursor from before a
+    # clear is rejected instead of resuming in the middle of unrelated data
+    token = json.dumps([offset, sources[offset - 1].get("name")], separators=(",", ":"))
+    return base64.urlsafe_b64encode(token.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor, sources):
+    try:
+        offset, name = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        offset = int(offset)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not 0 < offset <= len(sources) or sources[offset - 1].get("name") != name:
+        raise HTTPException(status_code=400, detail="Cursor expired, start again without a cursor")
+    return offset
+
+def _page_sources(sources, cursor, limit, fields):
+    """
+    One page of income sources and the cursor for the next page (None on the
+    last page). limit=None returns everything from the cursor on. fields is
+    a comma-separated list of keys to keep per source.
+    """
+    start = _decode_cursor(cursor, sources) if cursor else 0
+    end = len(sources) if limit is None else min(len(sources), start + limit)
+    page = sources[start:end]
+    if fields:
+        keep = [f.strip() for f in fields.split(",") if f.strip()]
+        page = [{k: s[k] for k in keep if k in s} for s in page]
+    return page, (_encode_cursor(sources, end) if end < len(sources) else None)
+
 @app.get("/api/dashboard")
-def get_dashboard():
+def get_dashboard(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = Query(default=None),
+    limit: int = Query(default=SOURCES_PAGE_DEFAULT, ge=1, le=SOURCES_PAGE_MAX),
+    fields: Optional[str] = Query(default=None),
+    since: Optional[str] = Query(default=None),
+):
     """
     Get dashboard data with income sources and monthly earnings.
-    Returns dynamic data from the earnings store.
+    Returns dynamic data from the earnings store. Sources come one page at a
+    time (limit, SOURCES_PAGE_DEFAULT by default); pass the returned
+    nextCursor back as cursor for the next one. fields=name,amount keeps only
+    those keys per source. Answers 304 when If-None-Match matches.
+
+    With since=<version from an earlier response> only the sources changed
+    since then (changedSources) and the ids removed (removedSourceIds) are
+    sent, with fresh totals. If that version is too old, the full dashboard
+    comes back instead, marked full: true.
     """
-    total = get_total_monthly_income()
+    snap = earnings_store.snapshot()
+    not_modified = _check_etag(request, response, snap)
+    if not_modified:
+        return not_modified
+    version = earnings_store.version_token(snap)
+    if since and fields:
+        # Delta clients match sources by id, so never trim it away
+        fields = f"id,{fields}"
+    delta = earnings_store.delta(since, snap) if since else None
+    if delta is not None:
+        changed, removed = delta
+        if fields:
+            changed, _ = _page_sources(changed, None, None, fields)
+        return {
+            "version": version,
+            "full": False,
+            "changedSources": changed,
+            "removedSourceIds": removed,
+            "earningsData": snap.monthly_earnings,
+            "totalMonthlyIncome": snap.total,
+            "totalSources": len(snap.income_sources)
+        }
+    sources, next_cursor = _page_sources(snap.income_sources, cursor, limit, fields)
     
     return {
-        "incomeSources": earnings_store["income_sources"],
-        "earningsData": earnings_store["monthly_earnings"],
-        "totalMonthlyIncome": total
+        "version": version,
+        "full": True,
+        "incomeSources": sources,
+        "earningsData": snap.monthly_earnings,
+        "totalMonthlyIncome": snap.total,
+        "totalSources": len(snap.income_sources),
+        "nextCursor": next_cursor
     }
 
 @app.post("/api/verify_document")
@@ -124,8 +313,8 @@ async def verify_document(file: UploadFile = File(...), doc_type: str = Form(...
         file_bytes = await file.read()
         mime_type = file.content_type or "image/jpeg"
         
-        # Use AI to verify document
-        result = verify_document_with_ai(file_bytes, mime_type, doc_type)
+        # Use AI to verify document (on the AI pool, off the event loop)
+        result = await ai_executor.run(verify_document_with_ai, file_bytes, mime_type, doc_type)
         
         is_income_proof = doc_type.lower() in ['income proof', 'income_proof', 'salary slip', 'bank statement', 'earning proof']
         
@@ -156,8 +345,12 @@ async def verify_document(file: UploadFile = File(...), doc_type: str = Form(...
                         "date": date_found,
                         "upload_time": datetime.now().isoformat()
                     }
-                    earnings_store["income_sources"].append(new_source)
-                    update_monthly_earnings()
+                    try:
+                        day = day_of(date_found)
+                    except (TypeError, ValueError):
+                        day = datetime.now().toordinal()
+                    # The commit may wait for the earnings log fsync: keep it off the event loop
+                    await asyncio.to_thread(_add_income_source, new_source, day)
                 
                 return {
                     "status": "verified",
@@ -171,7 +364,7 @@ async def verify_document(file: UploadFile = File(...), doc_type: str = Form(...
                     "message": f"Income proof verified. Detected ₹{total_amount:,.0f} from {source_name}",
                     "confidence_score": 0.92 if total_amount > 0 else 0.5,
                     "reason": result.get("reason"),
-                    "current_total": get_total_monthly_income()
+                    "current_total": earnings_store.get_total_monthly_income()
                 }
             else:
                 return {
@@ -212,8 +405,16 @@ async def verify_document(file: UploadFile = File(...), doc_type: str = Form(...
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _add_income_source(new_source: Dict, day: int):
+    """Add a source and its ledger row (a credit on day) in one commit."""
+    with earnings_store.transaction() as txn:
+        txn.add_source(new_source)
+        txn.record_ledger("default", {"days": [day], "amounts": [new_source["amount"]],
+                                      "merchants": [new_source["name"]], "types": ["credit"]})
+        txn.update_monthly_earnings()
+
 @app.post("/api/add_income")
-async def add_income_source(name: str = Form(...), amount: float = Form(...), source: str = Form("Manual")):
+def add_income_source(name: str = Form(...), amount: float = Form(...), source: str = Form("Manual")):
     """
     Manually add an income source.
     """
@@ -225,18 +426,113 @@ async def add_income_source(name: str = Form(...), amount: float = Form(...), so
         "description": f"Manually added income from {name}",
         "upload_time": datetime.now().isoformat()
     }
-    earnings_store["income_sources"].append(new_source)
-    update_monthly_earnings()
-    return {"status": "success", "message": f"Added {name} with ₹{amount}", "total": get_total_monthly_income()}
+    _add_income_source(new_source, datetime.now().toordinal())
+    return {"status": "success", "message": f"Added {name} with ₹{amount}", "total": earnings_store.get_total_monthly_income()}
 
 @app.delete("/api/clear_income")
-async def clear_income():
+def clear_income():
     """Clear all income sources (for testing)."""
-    earnings_store["income_sources"] = []
-    earnings_store["monthly_earnings"] = []
-    earnings_store["total_monthly_income"] = 0
+    earnings_store.clear()   # also clears the ledgers
+    sms_index.clear()
+    ingestion_watermarks.clear()
     return {"status": "cleared"}
 
+@app.get("/api/earnings_series")
+def get_earnings_series(
+    granularity: str = Query(default="month"),
+    start: Optional[str] = Query(default=None),
+    end: Optional[str] = Query(default=None),
+):
+    """
+    Monthly totals (YYYY-MM) or daily income added (YYYY-MM-DD) between
+    start and end inclusive, each with a per-platform breakdown.
+    """
+    try:
+        points = earnings_store.series(granularity, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "granularity": granularity,
+        "start": start,
+        "end": end,
+        "points": points,
+        "total": sum(p["amount"] for p in points),
+    }
+
+@app.get("/api/earnings_range")
+def get_earnings_range(
+    user_id: str = Query(default="default"),
+    start: Optional[str] = Query(default=None),
+    end: Optional[str] = Query(default=None),
+    group_by: str = Query(default="day"),
+    type: str = Query(default="credit"),
+    platform: Optional[str] = Query(default=None),
+):
+    """
+    Sum, count, min and max of individual transactions between start and
+    end (YYYY-MM-DD, inclusive), grouped by day, week, month or platform.
+    Omitting start or end leaves that side of the range open.
+    """
+    try:
+        start_day = day_of(start) if start else 1
+        end_day = day_of(end) if end else datetime.max.toordinal()
+        if start_day > end_day:
+            raise ValueError("start must not be after end")
+        buckets, overall = ledgers.get(user_id).aggregate(start_day, end_day, group_by, type, platform)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "user_id": user_id,
+        "start": start,
+        "end": end,
+        "group_by": group_by,
+        "type": type,
+        "platform": platform,
+        "buckets": buckets,
+        **overall,
+    }
+
+@app.get("/api/earnings_log_stats")
+def earnings_log_stats():
+    """Durability metrics: restore time at startup, fsync batching and write latency."""
+    if earnings_log is None:
+        return {"enabled": False}
+    return {"enabled": True, **earnings_log.stats()}
+
+def _record_sms_credit(r: Dict, target=None):
+    """
+    Add a parsed SMS credit to the earnings store, merging into an existing
+    source. Pass an open transaction as target to batch several credits.
+    """
+    (target or earnings_store).add_to_source(
+        r.get('merchant', 'SMS Income'),
+        r["amount"],
+        verified=True,
+        source="SMS",
+        description=r.get("description", "Parsed from SMS"),
+        upload_time=datetime.now().isoformat()
+    )
+
+def _record_sms_batch(user_id: str, batch):
+    """Add every credit of a parsed batch, and its ledger rows, to the earnings store in one atomic commit."""
+    with earnings_store.transaction() as txn:
+        txn.record_ledger(user_id, batch_rows(batch))
+        for i in range(len(batch)):
+            if batch.type(i) == 'credit' and batch.amounts[i] > 0:
+                _record_sms_credit({
+                    "merchant": batch.merchant(i),
+                    "amount": batch.amounts[i],
+                    "description": batch.description(i)
+                }, txn)
+        
+        if batch.total('credit') > 0:
+            txn.update_monthly_earnings()
+
+def _finish_sms_batch(user_id: str, fingerprints, highest: Optional[int]):
+    """Record an ingested batch in the dedup index; returns the new watermark."""
+    sms_index.add_all(fingerprints)
+    return _advance_watermark(user_id, highest)
+
 @app.post("/api/parse_sms")
 async def parse_sms_endpoint(request: SMSRequest):
     """
@@ -244,45 +540,213 @@ async def parse_sms_endpoint(request: SMSRequest):
     Also adds detected credits to the earnings store.
     """
     try:
-        # Use backend parser (no external LLM/API key dependency)
-        results = parser.parse_batch(request.messages)
-        
-        # Calculate summary
-        total_credit = sum(r.get('amount', 0) for r in results if r.get('type') == 'credit')
-        total_debit = sum(r.get('amount', 0) for r in results if r.get('type') == 'debit')
-        
-        # Add credit transactions to earnings store
-        for r in results:
-            if r.get('type') == 'credit' and r.get('amount', 0) > 0:
-                merchant = r.get('merchant', 'SMS Income')
-                # Check if this source already exists
-                existing = next((s for s in earnings_store["income_sources"] if s["name"] == merchant), None)
-                if existing:
-                    existing["amount"] += r["amount"]
-                else:
-                    earnings_store["income_sources"].append({
-                        "name": merchant,
-                        "amount": r["amount"],
-                        "verified": True,
-                        "source": "SMS",
-                        "description": r.get("description", "Parsed from SMS"),
-                        "upload_time": datetime.now().isoformat()
-                    })
+        # Drop anything older than what this user already synced, then skip
+        # messages already ingested by an earlier upload. State backend calls
+        # may wait on a lock, so they run off the event loop.
+        messages, message_ids, stale = await asyncio.to_thread(
+            _apply_watermark, request.user_id, request.messages, request.message_ids)
+        # Reserves the new fingerprints, so a concurrent identical upload skips them
+        messages, fingerprints, duplicates = await asyncio.to_thread(
+            sms_index.filter_new, messages, request.user_id, message_ids)
         
-        if total_credit > 0:
-            update_monthly_earnings()
+        try:
+            # Use backend parser (no external LLM/API key dependency)
+            stats = new_batch_stats()
+            batch = await parse_messages(messages, stats, keep_raw=request.include_raw)
+            
+            # Calculate summary
+            total_credit = batch.total('credit')
+            total_debit = batch.total('debit')
+            
+            # Add credit transactions to earnings store in one atomic batch
+            await asyncio.to_thread(_record_sms_batch, request.user_id, batch)
+        except Exception:
+            # Nothing was recorded: let a retry ingest these messages
+            await asyncio.to_thread(sms_index.release, fingerprints)
+            raise
+        except BaseException:
+            # Cancelled: another await could be cancelled before it runs, so release inline
+            sms_index.release(fingerprints)
+            raise
+        watermark = await asyncio.to_thread(
+            _finish_sms_batch, request.user_id, fingerprints, max(message_ids) if message_ids else None)
         
-        return {
-            "transactions": results,
+        # Serialize straight from the columnar batch, skipping FastAPI's
+        # per-field encoder pass over every transaction
+        return JSONResponse({
+            "transactions": batch.to_dicts(include_raw=request.include_raw),
             "summary": {
                 "total_credit": total_credit,
                 "total_debit": total_debit,
-                "count": len(results)
-            }
-        }
+                "count": len(batch),
+                "triaged_out": stats["triaged_out"],
+                "parsed": stats["parsed"],
+                "duplicates_skipped": duplicates,
+                "stale_skipped": stale
+            },
+            "watermark": watermark
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/sms_watermark")
+def get_sms_watermark(user_id: str = Query(default="default")):
+    """Latest message id processed for a user; clients send only messages above it."""
+    return {"user_id": user_id, "watermark": ingestion_watermarks.get(user_id)}
+
+async def _iter_body_lines(request: Request):
+    """Yield the request body line by line as it arrives."""
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+async def _iter_sms_lines(request: Request):
+    """
+    Decode newline-delimited messages into (message_id, text) pairs. A line may
+    be a JSON string (so SMS with embedded newlines survive), a JSON object
+    {"id": <int>, "message": "..."} for watermark-aware clients, or plain text.
+    """
+    async for line in _iter_body_lines(request):
+        text = line.decode("utf-8", errors="replace").strip()
+        if not text:
+            continue
+        message_id = None
+        if text[0] in '"{':
+            try:
+                value = json.loads(text)
+                if isinstance(value, str):
+                    text = value
+                elif isinstance(value, dict) and isinstance(value.get("message"), str):
+                    text = value["message"]
+                    if isinstance(value.get("id"), int):
+                        message_id = value["id"]
+            except ValueError:
+                pass
+        yield message_id, text
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body generator is itself reading the request.
+    The stock response listens for disconnects on receive() in parallel, which
+    would swallow the request body chunks, so stream directly instead; a client
+    disconnect still surfaces through request.stream().
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+def _ingest_stream_chunk(user_id: str, chunk: List, stats: Dict):
+    """
+    Dedupe, parse and record one chunk of streamed lines: the chunk's credits
+    and the monthly series go to the earnings store in a single commit.
+    Returns the parsed TransactionBatch.
+    """
+    messages = [msg for _, msg in chunk]
+    message_ids = [message_id for message_id, _ in chunk]
+    messages, fingerprints, duplicates = sms_index.filter_new(messages, user_id, message_ids)
+    stats["duplicates"] += duplicates
+    try:
+        batch = parser.parse_batch_compact(messages, stats, keep_raw=True)
+        _record_sms_batch(user_id, batch)
+    except BaseException:
+        sms_index.release(fingerprints)
+        raise
+    sms_index.add_all(fingerprints)
+    return batch
+
+@app.post("/api/parse_sms_stream")
+async def parse_sms_stream_endpoint(request: Request, user_id: str = Query(default="default")):
+    """
+    Streaming variant of /api/parse_sms for large exports.
+    Accepts one message per line and streams back NDJSON: one
+    {"transaction": ...} record per detected transaction, then a final
+    {"summary": ..., "watermark": ...} record. Memory stays flat regardless
+    of body size. Lines carrying an id are checked against user_id's watermark.
+    Lines are ingested in chunks of SMS_STREAM_CHUNK, one earnings commit each.
+    """
+    async def generate():
+        total_credit = 0.0
+        total_debit = 0.0
+        stats = {**new_batch_stats(), "duplicates": 0}
+        received = 0
+        stale = 0
+        # Compare against the watermark as of stream start, so out-of-order
+        # ids inside one upload are not dropped by the running maximum
+        watermark = await asyncio.to_thread(ingestion_watermarks.get, user_id)
+        highest = None
+        await asyncio.to_thread(_sync_registry)
+
+        async def ingest(chunk):
+            nonlocal total_credit, total_debit
+            batch = await asyncio.to_thread(_ingest_stream_chunk, user_id, chunk, stats)
+            total_credit += batch.total('credit')
+            total_debit += batch.total('debit')
+            return "".join(json.dumps({"transaction": info}) + "\n" for info in batch.iter_dicts(include_raw=True))
+
+        chunk = []
+        async for message_id, msg in _iter_sms_lines(request):
+            received += 1
+            if message_id is not None:
+                if watermark is not None and message_id <= watermark:
+                    stale += 1
+                    continue
+                highest = message_id if highest is None else max(highest, message_id)
+            chunk.append((message_id, msg))
+            if len(chunk) >= SMS_STREAM_CHUNK:
+                records = await ingest(chunk)
+                chunk = []
+                if records:
+                    yield records
+        if chunk:
+            records = await ingest(chunk)
+            if records:
+                yield records
+
+        watermark = await asyncio.to_thread(_advance_watermark, user_id, highest)
+
+        yield json.dumps({"summary": {
+            "total_credit": total_credit,
+            "total_debit": total_debit,
+            "count": stats["kept"],
+            "received": received,
+            "triaged_out": stats["triaged_out"],
+            "parsed": stats["parsed"],
+            "duplicates_skipped": stats["duplicates"],
+            "stale_skipped": stale
+        }, "watermark": watermark}) + "\n"
+
+    return NDJSONStreamingResponse(generate())
+
+@app.post("/api/reload_platforms")
+def reload_platforms():
+    """
+    Hot-reload the merchant/platform registry (platforms.json) without a restart.
+    The new version is compiled first and swapped in atomically; requests
+    already parsing finish on the version they started with. The loaded spec
+    is published in the state backend, and other workers switch to it on
+    their next parse.
+    """
+    try:
+        registry = parser.reload_registry()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    published_registry["current"] = {"checksum": registry.checksum, "spec": registry.spec}
+    return {
+        "status": "reloaded",
+        "version": registry.version,
+        "checksum": registry.checksum,
+        "platform_count": len(registry.platforms),
+        "allowed_count": len(registry.allowed)
+    }
+
 @app.post("/api/recommend_schemes")
 def recommend_schemes_endpoint(profile: UserProfile):
     """
@@ -293,7 +757,7 @@ def recommend_schemes_endpoint(profile: UserProfile):
         profile_dict = profile.dict()
         # If income is 0 or not provided, use dynamic income from earnings store
         if profile_dict.get("income", 0) <= 0:
-            profile_dict["income"] = get_total_monthly_income() * 12
+            profile_dict["income"] = earnings_store.get_total_monthly_income() * 12
         
         recommendations = get_eligible_schemes(profile_dict)
         return {"schemes": recommendations, "count": len(recommendations)}
@@ -305,11 +769,15 @@ def get_all_schemes():
     return {"schemes": SCHEMES_DB}
 
 @app.get("/api/loans")
-def get_loans():
+def get_loans(request: Request, response: Response):
     """
     Returns loan options filtered based on the user's actual verified income.
     """
-    monthly_income = get_total_monthly_income()
+    snap = earnings_store.snapshot()
+    not_modified = _check_etag(request, response, snap)
+    if not_modified:
+        return not_modified
+    monthly_income = snap.total
     
     all_loans = [
         {
@@ -405,10 +873,8 @@ async def chat_endpoint(request: ChatMessage):
     """
     try:
         # Get or create chat history
-        if request.session_id not in chat_sessions:
-            chat_sessions[request.session_id] = []
-        
-        history = chat_sessions[request.session_id]
+        # State backend calls may wait on a lock: keep them off the event loop
+        history = await asyncio.to_thread(chat_sessions.get, request.session_id) or []
         
         # Get AI response
         response = await chat_with_ai_assistant(request.message, history)
@@ -418,7 +884,7 @@ async def chat_endpoint(request: ChatMessage):
         history.append({"role": "assistant", "content": response})
         
         # Keep only last 20 messages
-        chat_sessions[request.session_id] = history[-20:]
+        await asyncio.to_thread(chat_sessions.__setitem__, request.session_id, history[-20:])
         
         return {
             "response": response,
@@ -459,6 +925,11 @@ class EarningsData(BaseModel):
     platform_data: Dict[str, float]  # {"Swiggy": 15000, "Zomato": 12000}
     total_earnings: float
 
+@app.get("/api/ai_metrics")
+def ai_metrics():
+    """Gemini call pool (concurrency, queue depth, latency), response cache counters and API key health."""
+    return {**ai_executor.stats(), "cache": ai_cache.stats(), "api_keys": key_pool.stats()}
+
 @app.post("/api/unified_dashboard")
 async def unified_dashboard_endpoint(request: EarningsData):
     """
@@ -504,14 +975,18 @@ async def simplify_scheme_endpoint(profile: UserProfile):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/tax_calculation")
-def calculate_tax():
+def calculate_tax(request: Request, response: Response):
     """
     Calculate tax based on DYNAMIC current earnings from the earnings store.
     Returns estimated annual income, tax payable, and refund eligibility.
     """
     try:
         # Use dynamic monthly income from the earnings store
-        monthly_income = get_total_monthly_income()
+        snap = earnings_store.snapshot()
+        not_modified = _check_etag(request, response, snap)
+        if not_modified:
+            return not_modified
+        monthly_income = snap.total
         annual_income = monthly_income * 12
         
         # Indian Income Tax Slabs (New Tax Regime 2024-25)
@@ -575,7 +1050,7 @@ def calculate_tax():
             "refund_eligible": round(refund_eligible, 2),
             "estimated_tds": round(estimated_tds, 2),
             "regime_note": regime_note,
-            "income_sources_count": len(earnings_store["income_sources"])
+            "income_sources_count": len(snap.income_sources)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -583,15 +1058,15 @@ def calculate_tax():
 
 # =================== REPORT GENERATION ===================
 
-from fastapi.responses import StreamingResponse
 import io
 from datetime import datetime
 
 def _build_text_report(report_type: str) -> str:
     """Build a plain-text report based on current earnings data."""
-    monthly = get_total_monthly_income()
+    snap = earnings_store.snapshot()
+    monthly = snap.total
     annual = monthly * 12
-    sources = earnings_store["income_sources"]
+    sources = snap.income_sources
     now = datetime.now().strftime("%d-%b-%Y %I:%M %p")
     
     lines = [
@@ -614,6 +1089,13 @@ def _build_text_report(report_type: str) -> str:
     for src in sources:
         lines.append(f"    • {src['source']:30s}  ₹{src['amount']:>12,.2f}")
     
+    lines.append("")
+    lines.append("-" * 60)
+    lines.append("  MONTHLY TREND")
+    lines.append("-" * 60)
+    for entry in snap.monthly_earnings:
+        lines.append(f"    {entry['period']}  {entry['month']:3s}            ₹{entry['amount']:>12,.2f}")
+    
     lines.append("")
     lines.append("-" * 60)
     
@@ -704,7 +1186,7 @@ import random
 import hashlib
 
 # In-memory OTP store (use Redis/DB in production)
-otp_store: Dict[str, Dict] = {}
+otp_store = state.namespace("otp")
 
 class OTPRequest(BaseModel):
     target: str  # phone number or email
@@ -720,7 +1202,7 @@ def _hash_target(target: str) -> str:
     return hashlib.sha256(target.strip().lower().encode()).hexdigest()
 
 @app.post("/api/send_otp")
-async def send_otp(request: OTPRequest):
+def send_otp(request: OTPRequest):
     """
     Send OTP to phone number or email.
     In production, integrate with an SMS gateway (e.g., Twilio, MSG91) or email service.
@@ -772,7 +1254,7 @@ async def send_otp(request: OTPRequest):
 
 
 @app.post("/api/verify_otp")
-async def verify_otp(request: OTPVerifyRequest):
+def verify_otp(request: OTPVerifyRequest):
     """
     Verify OTP for phone or email.
     Accepts the actual generated OTP or '123456' for demo purposes.
@@ -792,7 +1274,7 @@ async def verify_otp(request: OTPVerifyRequest):
         # Accept demo OTP "123456" or the actual generated OTP
         if otp == "123456" or (stored and stored.get("otp") == otp):
             # Clean up used OTP
-            if key in otp_store:
+            if stored:
                 del otp_store[key]
             
             return {
@@ -804,6 +1286,7 @@ async def verify_otp(request: OTPVerifyRequest):
             # Increment attempt counter
             if stored:
                 stored["attempts"] = stored.get("attempts", 0) + 1
+                otp_store[key] = stored
             
             return {
                 "success": False,
@@ -818,19 +1301,16 @@ async def verify_otp(request: OTPVerifyRequest):
 # ---------------------------------------------------------------------------
 
 @app.delete("/api/delete_all_data")
-async def delete_all_data():
+def delete_all_data():
     """
     Nuclear option — delete ALL user data from the system.
     Clears earnings, chat sessions, OTP states, everything.
     """
-    global earnings_store, chat_sessions, otp_store
-    earnings_store = {
-        "income_sources": [],
-        "monthly_earnings": [],
-        "total_monthly_income": 0,
-    }
+    earnings_store.clear()   # also clears the ledgers
     chat_sessions.clear()
     otp_store.clear()
+    sms_index.clear()
+    ingestion_watermarks.clear()
     return {
         "status": "deleted",
         "message": "All data has been permanently deleted. Earnings, chat history, and sessions have been wiped.",
@@ -839,19 +1319,38 @@ async def delete_all_data():
 
 
 @app.get("/api/export_earnings")
-async def export_earnings(format: str = Query(default="json")):
+async def export_earnings(
+    request: Request,
+    response: Response,
+    format: str = Query(default="json"),
+    cursor: Optional[str] = Query(default=None),
+    limit: int = Query(default=SOURCES_PAGE_DEFAULT, ge=1, le=SOURCES_PAGE_MAX),
+    fields: Optional[str] = Query(default=None),
+):
     """
     Export all earnings data so the user owns their data.
-    Supports JSON format. Frontend converts to PDF.
+    Supports JSON format. Frontend converts to PDF. Sources are exported one
+    page at a time like the dashboard (limit, then cursor=next_cursor);
+    the summary always covers every source. fields trims each source.
+    The ETag is weak because exported_at differs between identical exports.
     """
+    snap = earnings_store.snapshot()
+    not_modified = _check_etag(request, response, snap, weak=True)
+    if not_modified:
+        return not_modified
+    sources, next_cursor = _page_sources(snap.income_sources, cursor, limit, fields)
     return {
         "exported_at": datetime.now().isoformat(),
-        "income_sources": earnings_store["income_sources"],
-        "monthly_earnings": earnings_store["monthly_earnings"],
-        "total_monthly_income": earnings_store["total_monthly_income"],
+        "income_sources": sources,
+        "next_cursor": next_cursor,
+        "monthly_earnings": snap.monthly_earnings,
+        "total_monthly_income": snap.total_monthly_income,
         "summary": {
-            "total_sources": len(earnings_store["income_sources"]),
-            "total_income": get_total_monthly_income(),
+            "total_sources": len(snap.income_sources),
+            "total_income": snap.total,
+            "by_source": dict(snap.by_source),
+            "by_platform": dict(snap.by_platform),
+            "by_month": dict(snap.by_month),
         }
     }
 
@@ -0,0 +1,176 @@
+"""
+Copy-on-write list and dict for the earnings snapshots.
+
+Both keep their items in fixed-size pages (buckets by key hash for the
+dict) behind an outer list. copy() copies only that outer list and shares
+every page; the first write to a shared page copies just that page. A
+writer that changes k items of an n-item collection therefore pays about
+n / page_size + k * page_size instead of n, and the original never sees
+the change. The store only writes to unpublished drafts, so once a copy is
+taken the original is treated as read-only.
+"""
+
+from collections.abc import MutableMapping
+
+
+class PagedList:
+    """List with copy-on-write pages. Supports len, iteration, indexing, slicing, item assignment and append."""
+
+    __slots__ = ("pages", "page_size", "_length", "_owned")
+
+    def __init__(self, items=(), page_size=256):
+        self.page_size = page_size
+        items = list(items)
+        self.pages = [items[i:i + page_size] for i in range(0, len(items), page_size)]
+        self._length = len(items)
+        self._owned = set(range(len(self.pages)))
+
+    def copy(self):
+        clone = object.__new__(PagedList)
+        clone.pages = list(self.pages)
+        clone.page_size = self.page_size
+        clone._length = self._length
+        clone._owned = set()
+        self._owned = set()       # pages are shared from now on
+        return clone
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page
+
+    def _index(self, i):
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError("PagedList index out of range")
+        return divmod(i, self.page_size)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self._length)
+            if step != 1:
+                return list(self)[i]
+            items = []
+            while start < stop:
+                page, offset = divmod(start, self.page_size)
+                chunk = self.pages[page][offset:offset + stop - start]
+                items.extend(chunk)
+                start += len(chunk)
+            return items
+        page, offset = self._index(i)
+        return self.pages[page][offset]
+
+    def _writable(self, page):
+        if page not in self._owned:
+            self.pages[page] = list(self.pages[page])
+            self._owned.add(page)
+        return self.pages[page]
+
+    def __setitem__(self, i, value):
+        page, offset = self._index(i)
+        self._writable(page)[offset] = value
+
+    def append(self, value):
+        if self.pages and len(self.pages[-1]) < self.page_size:
+            self._writable(len(self.pages) - 1).append(value)
+        else:
+            self.pages.append([value])
+            self._owned.add(len(self.pages) - 1)
+        self._length += 1
+
+    def __repr__(self):
+        return f"PagedList({list(self)!r})"
+
+
+class PagedDict(MutableMapping):
+    """
+    Dict with copy-on-write hash buckets. With a default factory, reading a
+    missing key returns a fresh default (without inserting it), so
+    `d[key] += 1` works as with a defaultdict.
+    """
+
+    __slots__ = ("buckets", "default", "_length", "_owned")
+
+    BUCKET_LOAD = 128     # average keys per bucket before the table grows
+
+    def __init__(self, items=(), default=None):
+        self.default = default
+        self.buckets = [{} for _ in range(8)]
+        self._owned = set(range(len(self.buckets)))
+        self._length = 0
+        for key, value in (items.items() if hasattr(items, "items") else items):
+            self[key] = value
+
+    def copy(self):
+        clone = object.__new__(PagedDict)
+        clone.buckets = list(self.buckets)
+        clone.default = self.default
+        clone._length = self._length
+        clone._owned = set()
+        self._owned = set()       # buckets are shared from now on
+        return clone
+
+    def _bucket(self, key):
+        return hash(key) & (len(self.buckets) - 1)
+
+    def _writable(self, b):
+        if b not in self._owned:
+            self.buckets[b] = dict(self.buckets[b])
+            self._owned.add(b)
+        return self.buckets[b]
+
+    def _grow(self):
+        old = self.buckets
+        self.buckets = [{} for _ in range(len(old) * 4)]
+        self._owned = set(range(len(self.buckets)))
+        for bucket in old:
+            for key, value in bucket.items():
+                self.buckets[self._bucket(key)][key] = value
+
+    def __getitem__(self, key):
+        bucket = self.buckets[self._bucket(key)]
+        if key in bucket:
+            return bucket[key]
+        if self.default is not None:
+            return self.default()
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        return self.buckets[self._bucket(key)].get(key, default)
+
+    def __contains__(self, key):
+        return key in self.buckets[self._bucket(key)]
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self.get(key)
+        self[key] = default
+        return default
+
+    def __setitem__(self, key, value):
+        bucket = self._writable(self._bucket(key))
+        if key not in bucket:
+            self._length += 1
+        bucket[key] = value
+        if self._length > self.BUCKET_LOAD * len(self.buckets):
+            self._grow()
+
+    def __delitem__(self, key):
+        b = self._bucket(key)
+        if key not in self.buckets[b]:
+            raise KeyError(key)
+        del self._writable(b)[key]
+        self._length -= 1
+
+    def __iter__(self):
+        for bucket in self.buckets:
+            yield from bucket
+
+    def __len__(self):
+        return self._length
+
+    def __repr__(self):
+        return f"PagedDict({dict(self)!r})"
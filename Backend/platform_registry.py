@@ -0,0 +1,231 @@
+"""
+Merchant/platform registry for the SMS parser.
+
+Platforms are listed in priority order in a JSON data file (platforms.json
+by default, or PLATFORM_REGISTRY_PATH). Each entry has a display name,
+lower-case text aliases (a space matches any run of whitespace, or none),
+SMS sender IDs (matched as whole words) and an `allowed` flag marking gig
+platforms whose transactions are kept.
+
+compile_registry turns that data into an immutable CompiledRegistry. Aliases
+are folded into a character trie before being emitted as a regex, so matching
+cost per position grows with alias length rather than with merchant count.
+"""
+
+import hashlib
+import json
+import os
+import re
+
+DEFAULT_REGISTRY_PATH = os.getenv(
+    "PLATFORM_REGISTRY_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "platforms.json"),
+)
+
+_TERMINAL = ''
+_WHITESPACE_ATOM = r'\s*'
+_BOUNDARY_ATOM = r'\b'
+
+
+def load_registry(path=None):
+    """Read and validate a registry file. Raises ValueError on bad data."""
+    path = path or DEFAULT_REGISTRY_PATH
+    try:
+        with open(path, encoding='utf-8') as f:
+            spec = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"Could not read platform registry {path}: {e}")
+    validate_registry(spec)
+    return spec
+
+
+def validate_registry(spec):
+    platforms = spec.get("platforms") if isinstance(spec, dict) else None
+    if not isinstance(platforms, list):
+        raise ValueError("Platform registry needs a 'platforms' list")
+    names = set()
+    for entry in platforms:
+        name = entry.get("name") if isinstance(entry, dict) else None
+        if not name or not isinstance(name, str):
+            raise ValueError(f"Platform entry without a name: {entry!r}")
+        if name in names:
+            raise ValueError(f"Duplicate platform name: {name}")
+        names.add(name)
+        keywords = list(entry.get("aliases", [])) + list(entry.get("sender_ids", []))
+        if not keywords or not all(isinstance(k, str) and k.strip() for k in keywords):
+            raise ValueError(f"Platform {name} needs at least one non-empty alias or sender ID")
+
+
+def _leading_chars(source):
+    """
+    Return the lower-cased first characters of every top-level branch of a
+    keyword regex, or None when a branch does not start with a plain letter.
+    """
+    if source.startswith('(') and source.endswith(')') and not source.startswith('(?'):
+        depth = 0
+        for i, ch in enumerate(source):
+            depth += ch == '('
+            depth -= ch == ')'
+            if depth == 0 and i < len(source) - 1:
+                break
+        else:
+            source = source[1:-1]
+
+    heads = set()
+    depth = 0
+    branch_start = True
+    for ch in source:
+        if branch_start:
+            if not ch.isalnum():
+                return None
+            heads.add(ch.lower())
+            branch_start = False
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == '|' and depth == 0:
+            branch_start = True
+    return heads
+
+
+def _guard(heads):
+    """Lookahead on the possible first characters, so other positions are skipped cheaply."""
+    if not heads:
+        return ''
+    return f"(?=[{re.escape(''.join(sorted(heads)))}])"
+
+
+def _alias_atoms(alias):
+    atoms = []
+    for ch in alias.strip().lower():
+        if ch.isspace():
+            if atoms[-1] != _WHITESPACE_ATOM:
+                atoms.append(_WHITESPACE_ATOM)
+        else:
+            atoms.append(re.escape(ch))
+    return atoms
+
+
+def _sender_atoms(sender_id):
+    return [_BOUNDARY_ATOM] + _alias_atoms(sender_id) + [_BOUNDARY_ATOM]
+
+
+def _trie_regex(entries):
+    """
+    Build a regex from (atoms, group) pairs by merging shared prefixes.
+    A terminal emits an empty named group (or nothing when group is None) so
+    the caller can tell which keyword matched via lastgroup. Longer keywords
+    are tried before a shorter one ending at the same node, so only the
+    longest keyword on a path is reported; callers that rank keywords fold
+    the shorter ones into it (see _path_best).
+    """
+    root = {}
+    for atoms, group in entries:
+        node = root
+        for atom in atoms:
+            node = node.setdefault(atom, {})
+        # First registration wins, keeping platform priority
+        node.setdefault(_TERMINAL, group)
+
+    def build(node):
+        branches = [atom + build(child) for atom, child in node.items() if atom != _TERMINAL]
+        if _TERMINAL in node:
+            group = node[_TERMINAL]
+            branches.append(f"(?P<{group}>)" if group else '')
+        if len(branches) == 1:
+            return branches[0]
+        return f"(?:{'|'.join(branches)})"
+
+    return build(root)
+
+
+def _path_best(entries):
+    """
+    For (atoms, value) pairs in priority order, map each atoms tuple to the
+    best value among the keywords that are a prefix of it (itself included).
+    Whenever the trie reports a keyword, each of those matched as well.
+    """
+    first = {}
+    for atoms, value in entries:
+        first.setdefault(tuple(atoms), value)
+    best = {}
+    for atoms, value in entries:
+        atoms = tuple(atoms)
+        best[atoms] = min((first[atoms[:i]] for i in range(1, len(atoms) + 1) if atoms[:i] in first),
+                          key=lambda v: v[0])
+    return best
+
+
+class CompiledRegistry:
+    """
+    Immutable, ready-to-match view of one registry version. The parser swaps
+    whole instances, so a batch that grabbed a reference keeps a consistent view.
+    """
+
+    __slots__ = ('spec', 'version', 'checksum', 'platforms', 'allowed',
+                 'keyword_scanner', 'keyword_groups', 'platform_filter')
+
+    def __init__(self, spec, credit_source, debit_source):
+        validate_registry(spec)
+        self.spec = spec
+        self.version = spec.get("version")
+        self.checksum = hashlib.sha1(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+        self.platforms = [entry["name"] for entry in spec["platforms"]]
+        self.allowed = frozenset(entry["name"] for entry in spec["platforms"] if entry.get("allowed", True))
+
+        # group name -> (rank, platform) for merchants, or the literal 'credit' / 'debit'
+        self.keyword_groups = {'credit': 'credit', 'debit': 'debit'}
+        ranked = []
+        heads = set()
+        for rank, entry in enumerate(spec["platforms"]):
+            name = entry["name"]
+            keywords = [(_alias_atoms(a), a) for a in entry.get("aliases", [])]
+            keywords += [(_sender_atoms(s), s) for s in entry.get("sender_ids", [])]
+            for atoms, text in keywords:
+                ranked.append((atoms, (rank, name)))
+                heads.add(text.strip()[0].lower())
+
+        # A match on "amazon pay" is also a match on "amazon": report the
+        # better-ranked platform of the two
+        best = _path_best(ranked)
+        merchant_entries = []
+        filter_entries = []
+        for atoms, (rank, name) in ranked:
+            group = f"k{len(merchant_entries)}"
+            self.keyword_groups[group] = best[tuple(atoms)]
+            merchant_entries.append((atoms, group))
+            if name in self.allowed:
+                filter_entries.append((atoms, None))
+
+        # All merchant, credit and debit keywords in one zero-width scanner.
+        # Everything is matched inside lookaheads, so overlapping keywords
+        # (e.g. "paid" and "dunzo" sharing a "d") are still reported. The first
+        # lookahead skips positions where nothing matches; the next three try
+        # each kind separately, so a credit/debit keyword starting where a
+        # merchant alias does is not hidden by it. The merchant trie comes
+        # last, so its group is lastgroup whenever it matched.
+        credit_heads = _leading_chars(credit_source)
+        debit_heads = _leading_chars(debit_source)
+        scan_heads = None if credit_heads is None or debit_heads is None else heads | credit_heads | debit_heads
+        any_keyword = '|'.join([
+            _trie_regex([(atoms, None) for atoms, _ in merchant_entries]),
+            f"(?:{credit_source})",
+            f"(?:{debit_source})",
+        ])
+        self.keyword_scanner = re.compile(
+            f"{_guard(scan_heads)}(?=(?:{any_keyword}))"
+            f"(?=(?P<credit>{credit_source})?)"
+            f"(?=(?P<debit>{debit_source})?)"
+            f"(?=(?:{_trie_regex(merchant_entries)})?)"
+        )
+
+        if filter_entries:
+            filter_heads = {
+                text.strip()[0].lower()
+                for entry in spec["platforms"] if entry["name"] in self.allowed
+                for text in entry.get("aliases", []) + entry.get("sender_ids", [])
+            }
+            self.platform_filter = re.compile(_guard(filter_heads) + _trie_regex(filter_entries))
+        else:
+            self.platform_filter = re.compile(r'(?!)')
@@ -0,0 +1,129 @@
+"""
+ArthikSetu — Tiny in-memory Redis-protocol server for local testing.
+Implements just the commands RedisBackend uses, so the redis:// state
+backend can be exercised without installing Redis.
+
+Run:  python redis_standin.py --port 6390
+Then: STATE_BACKEND=redis://localhost:6390/0 uvicorn main:app --workers 4
+"""
+
+import argparse
+import socketserver
+import threading
+import time
+
+_data = {}
+_expiry = {}
+_lock = threading.Lock()
+
+
+def _expired(key):
+    deadline = _expiry.get(key)
+    if deadline is not None and deadline <= time.monotonic():
+        _data.pop(key, None)
+        _expiry.pop(key, None)
+        return True
+    return False
+
+
+def _bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    data = value.encode("utf-8") if isinstance(value, str) else value
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+def execute(args):
+    """Run one command (list of str) against the shared dataset and return the RESP reply."""
+    cmd = args[0].upper()
+    with _lock:
+        for key in args[1:2]:
+            _expired(key)
+        if cmd == "PING":
+            return b"+PONG\r\n"
+        if cmd in ("AUTH", "SELECT"):
+            return b"+OK\r\n"
+        if cmd == "GET":
+            value = _data.get(args[1])
+            return _bulk(value if isinstance(value, str) else None)
+        if cmd == "SET":
+            key, value, options = args[1], args[2], [a.upper() for a in args[3:]]
+            if "NX" in options and key in _data:
+                return _bulk(None)
+            _data[key] = value
+            _expiry.pop(key, None)
+            if "PX" in options:
+                _expiry[key] = time.monotonic() + int(args[3 + options.index("PX") + 1]) / 1000
+            return b"+OK\r\n"
+        if cmd == "DEL":
+            removed = sum(_data.pop(k, None) is not None for k in args[1:])
+            for k in args[1:]:
+                _expiry.pop(k, None)
+            return b":%d\r\n" % removed
+        if cmd == "HGET":
+            return _bulk(_data.get(args[1], {}).get(args[2]))
+        if cmd == "HMGET":
+            h = _data.get(args[1], {})
+            return b"*%d\r\n" % len(args[2:]) + b"".join(_bulk(h.get(f)) for f in args[2:])
+        if cmd == "HSETNX":
+            h = _data.setdefault(args[1], {})
+            if args[2] in h:
+                return b":0\r\n"
+            h[args[2]] = args[3]
+            return b":1\r\n"
+        if cmd == "HSET":
+            h = _data.setdefault(args[1], {})
+            added = 0
+            for field, value in zip(args[2::2], args[3::2]):
+                added += field not in h
+                h[field] = value
+            return b":%d\r\n" % added
+        if cmd == "HDEL":
+            h = _data.get(args[1], {})
+            return b":%d\r\n" % sum(h.pop(f, None) is not None for f in args[2:])
+        if cmd == "FLUSHALL":
+            _data.clear()
+            _expiry.clear()
+            return b"+OK\r\n"
+    return b"-ERR unknown command '%s'\r\n" % cmd.encode()
+
+
+class RESPHandler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.decode().split()  # inline command, e.g. from telnet
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2].decode("utf-8"))
+        return args
+
+    def handle(self):
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            if args:
+                self.wfile.write(execute(args))
+
+
+class StandinServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=6390)
+    args = ap.parse_args()
+    with StandinServer((args.host, args.port), RESPHandler) as server:
+        print(f"Redis stand-in listening on {args.host}:{args.port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(text, user_id=None, message_id=None):
+    """
+    Hash of the normalized SMS text (case and whitespace insensitive), scoped
+    to the user and, when the client sends one, the message id: the same
+    payout notice received by two users, or on two days, is not a repeat.
+    """
+    normalized = _WHITESPACE.sub(' ', text).strip().lower()
+    if user_id is not None:
+        normalized = f"{user_id}\0{'' if message_id is None else message_id}\0{normalized}"
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over 16-byte fingerprints."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, fp):
+        # Double hashing: the fingerprint is already uniformly distributed
+        h1 = int.from_bytes(fp[:8], 'little')
+        h2 = int.from_bytes(fp[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, fp):
+        for pos in self._positions(fp):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, fp):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(fp))
+
+
+class FingerprintIndex:
+    """
+    Bounded-memory record of SMS that were already ingested.
+
+    Recent fingerprints are kept exactly; older ones live in two rotating
+    Bloom filter generations, so memory stays fixed while a message re-sent
+    within roughly two generations is still recognised (with a small false
+    positive rate set by error_rate).
+
+    filter_new() reserves the fingerprints it returns, so a concurrent upload
+    of the same messages sees them as duplicates while the first one is still
+    being parsed; add_all() makes the reservation permanent and release()
+    drops it if ingestion fails.
+    """
+
+    def __init__(self, recent_size=50_000, generation_capacity=500_000, error_rate=1e-4):
+        self.recent_size = recent_size
+        self.generation_capacity = generation_capacity
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._pending = set()
+        self._recent = OrderedDict()
+        self._current = BloomFilter(self.generation_capacity, self.error_rate)
+        self._previous = None
+
+    def seen(self, fp):
+        if fp in self._recent or fp in self._pending:
+            return True
+        if fp in self._current:
+            return True
+        return self._previous is not None and fp in self._previous
+
+    def add(self, fp):
+        if fp in self._recent:
+            return
+        self._recent[fp] = None
+        if len(self._recent) > self.recent_size:
+            self._recent.popitem(last=False)
+
+        if self._current.count >= self.generation_capacity:
+            self._previous = self._current
+            self._current = BloomFilter(self.generation_capacity, self.error_rate)
+        self._current.add(fp)
+
+    def add_all(self, fps):
+        with self._lock:
+            for fp in fps:
+                self._pending.discard(fp)
+                self.add(fp)
+
+    def release(self, fps):
+        with self._lock:
+            self._pending.difference_update(fps)
+
+    def filter_new(self, messages, user_id=None, message_ids=None):
+        """
+        Split a batch into messages not seen (or reserved) before, dropping
+        repeats inside the batch too, and reserve the new ones. Fingerprints
+        are scoped to user_id and to message_ids when given (see fingerprint).
+        Returns (new_messages, their_fingerprints, skipped_count); call add_all
+        with the fingerprints once they have been ingested, or release on failure.
+        """
+        new_messages = []
+        fps = []
+        ids = message_ids or [None] * len(messages)
+        with self._lock:
+            for msg, message_id in zip(messages, ids):
+                fp = fingerprint(msg, user_id, message_id)
+                if self.seen(fp):
+                    continue
+                self._pending.add(fp)
+                new_messages.append(msg)
+                fps.append(fp)
+        return new_messages, fps, len(messages) - len(new_messages)
+
+
+class SharedFingerprintIndex:
+    """
+    Record of ingested SMS kept in a StateBackend, so every worker skips the
+    same re-uploaded messages. Exact (no Bloom filter), and claimed with an
+    insert-if-absent, so two workers ingesting the same upload at once
+    cannot both count it.
+
+    Fingerprints are stored in one namespace per generation of
+    `generation_s` seconds; lookups cover the current and the previous
+    generation and older ones are dropped, so a message re-sent within one
+    to two generations is still recognised while the backend stays bounded.
+    """
+
+    NAMESPACE = "sms_fingerprints"
+    META = "sms_fingerprints_meta"
+
+    def __init__(self, backend, generation_s=7 * 86400):
+        self.backend = backend
+        self.generation_s = generation_s
+        self._generation = None
+
+    def _namespaces(self):
+        """(current, previous) generation namespaces, dropping expired ones on rollover."""
+        generation = int(time.time() // self.generation_s)
+        if generation != self._generation:
+            self._rotate(generation)
+        return f"{self.NAMESPACE}:{generation}", f"{self.NAMESPACE}:{generation - 1}"
+
+    def _rotate(self, generation):
+        with self.backend.lock(self.META):
+            known = self.backend.get(self.META, "generations") or []
+            for old in known:
+                if old < generation - 1:
+                    self.backend.clear(f"{self.NAMESPACE}:{old}")
+            live = sorted({g for g in known if g >= generation - 1} | {generation})
+            self.backend.set(self.META, "generations", live)
+        self._generation = generation
+
+    def clear(self):
+        current, previous = self._namespaces()
+        with self.backend.lock(self.META):
+            for generation in self.backend.get(self.META, "generations") or []:
+                self.backend.clear(f"{self.NAMESPACE}:{generation}")
+            self.backend.clear(current)
+            self.backend.clear(previous)
+            self.backend.delete(self.META, "generations")
+        self._generation = None
+
+    def seen(self, fp):
+        current, previous = self._namespaces()
+        key = fp.hex()
+        return self.backend.get(current, key) is not None or self.backend.get(previous, key) is not None
+
+    def add(self, fp):
+        self.backend.set(self._namespaces()[0], fp.hex(), 1)
+
+    def add_all(self, fps):
+        # filter_new already claimed them in the backend
+        pass
+
+    def release(self, fps):
+        current, previous = self._namespaces()
+        keys = [fp.hex() for fp in fps]
+        self.backend.delete_many(current, keys)
+        self.backend.delete_many(previous, keys)
+
+    def filter_new(self, messages, user_id=None, message_ids=None):
+        """FingerprintIndex.filter_new with one bulk claim and one bulk lookup per batch."""
+        current, previous = self._namespaces()
+        candidates = {}
+        for msg, message_id in zip(messages, message_ids or [None] * len(messages)):
+            candidates.setdefault(fingerprint(msg, user_id, message_id).hex(), msg)
+        claimed = self.backend.add_missing(current, dict.fromkeys(candidates, 1))
+        # Claimed now but already ingested in the previous generation: a repeat
+        # (the claim just carries it into the current one)
+        older = self.backend.get_many(previous, claimed)
+        new_keys = [key for key in claimed if key not in older]
+        new_messages = [candidates[key] for key in new_keys]
+        return new_messages, [bytes.fromhex(key) for key in new_keys], len(messages) - len(new_messages)
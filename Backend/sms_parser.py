@@ -1,8 +1,160 @@
+import os
 import re
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+from itertools import repeat
+from threading import Lock
+
+from platform_registry import CompiledRegistry, load_registry
+
+_TEXTUAL_DATE = re.compile(r'([A-Za-z]{3,9})\s+(\d{1,2}),\s*(\d{2,4})')
+
+
+def today_iso():
+    return datetime.now().strftime('%Y-%m-%d')
+
+
+@lru_cache(maxsize=4096)
+def normalize_date(token):
+    """
+    Convert a matched date token ("12-Jan-24", "12/01/2024", "Jan 12, 2024")
+    to an ISO date string. Returns None when the token is not a real date.
+    Day-first ordering is assumed for numeric dates, as used by Indian banks.
+    """
+    textual = _TEXTUAL_DATE.fullmatch(token)
+    if textual:
+        month, day, year = textual.groups()
+        cleaned = f"{day}-{month[:3]}-{year}"
+    else:
+        cleaned = token.replace('/', '-')
+        year = cleaned.rsplit('-', 1)[-1]
+
+    if len(year) == 2:
+        year_format = '%y'
+    elif len(year) == 4:
+        year_format = '%Y'
+    else:
+        return None
+
+    month_format = '%m' if cleaned.split('-')[1].isdigit() else '%b'
+    try:
+        return datetime.strptime(cleaned, f'%d-{month_format}-{year_format}').strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def new_batch_stats():
+    """Counters reported per batch: messages seen, rejected by triage, fully parsed and kept."""
+    return {"received": 0, "triaged_out": 0, "parsed": 0, "kept": 0}
+
+
+def describe_transaction(amount, merchant, ttype):
+    if ttype == 'credit':
+        return f"Credit of Rs {amount:,.2f} from {merchant}"
+    if ttype == 'debit':
+        return f"Debit of Rs {amount:,.2f} to {merchant}"
+    return f"Transaction of Rs {amount:,.2f} involving {merchant}"
+
+
+TYPE_CODES = ('unknown', 'credit', 'debit')
+_TYPE_INDEX = {name: code for code, name in enumerate(TYPE_CODES)}
+
+
+class TransactionBatch:
+    """
+    Columnar parser output for large batches.
+
+    Amounts live in a float array, merchants and dates are dictionary-encoded
+    into small integer arrays and the type is a one-byte code. Descriptions
+    are built on demand and the raw SMS text is only kept when asked for.
+    """
+
+    __slots__ = ('amounts', 'merchant_ids', 'type_codes', 'date_ids',
+                 'merchants', 'dates', 'raw', '_merchant_ids', '_date_ids')
+
+    def __init__(self, keep_raw=False):
+        self.amounts = array('d')
+        self.merchant_ids = array('H')
+        self.type_codes = array('b')
+        self.date_ids = array('I')
+        self.merchants = []
+        self.dates = []
+        self.raw = [] if keep_raw else None
+        self._merchant_ids = {}
+        self._date_ids = {}
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def _intern(self, value, values, ids):
+        index = ids.get(value)
+        if index is None:
+            index = ids[value] = len(values)
+            values.append(value)
+        return index
+
+    def append(self, amount, merchant, ttype, date, raw=None):
+        self.amounts.append(amount)
+        self.merchant_ids.append(self._intern(merchant, self.merchants, self._merchant_ids))
+        self.type_codes.append(_TYPE_INDEX[ttype])
+        self.date_ids.append(self._intern(date, self.dates, self._date_ids))
+        if self.raw is not None:
+            self.raw.append(raw)
+
+    def extend(self, other):
+        """Append another batch (e.g. a process-pool chunk), remapping its dictionaries."""
+        merchant_map = [self._intern(m, self.merchants, self._merchant_ids) for m in other.merchants]
+        date_map = [self._intern(d, self.dates, self._date_ids) for d in other.dates]
+        self.amounts.extend(other.amounts)
+        self.merchant_ids.extend(merchant_map[i] for i in other.merchant_ids)
+        self.type_codes.extend(other.type_codes)
+        self.date_ids.extend(date_map[i] for i in other.date_ids)
+        if self.raw is not None:
+            self.raw.extend(other.raw if other.raw is not None else repeat(None, len(other)))
+
+    def merchant(self, i):
+        return self.merchants[self.merchant_ids[i]]
+
+    def type(self, i):
+        return TYPE_CODES[self.type_codes[i]]
+
+    def date(self, i):
+        return self.dates[self.date_ids[i]]
+
+    def description(self, i):
+        return describe_transaction(self.amounts[i], self.merchant(i), self.type(i))
+
+    def total(self, ttype):
+        code = _TYPE_INDEX[ttype]
+        return sum(amount for amount, c in zip(self.amounts, self.type_codes) if c == code)
+
+    def iter_dicts(self, include_raw=False):
+        """Yield the classic per-transaction dicts, as returned by extract_info."""
+        merchants, dates = self.merchants, self.dates
+        include_raw = include_raw and self.raw is not None
+        for i, (amount, merchant_id, code, date_id) in enumerate(
+                zip(self.amounts, self.merchant_ids, self.type_codes, self.date_ids)):
+            merchant = merchants[merchant_id]
+            ttype = TYPE_CODES[code]
+            row = {
+                "amount": amount,
+                "merchant": merchant,
+                "type": ttype,
+                "date": dates[date_id],
+                "description": describe_transaction(amount, merchant, ttype),
+            }
+            if include_raw:
+                row["raw"] = self.raw[i]
+            yield row
+
+    def to_dicts(self, include_raw=False):
+        return list(self.iter_dicts(include_raw))
+
 
 class SMSParser:
-    def __init__(self):
+    def __init__(self, registry=None):
         # Patterns for extraction
         self.amount_pattern = re.compile(
             r'(?:₹|Rs\.?|INR)\s*([\d,]+(?:\.\d{1,2})?)|([\d,]+(?:\.\d{1,2})?)\s*(?:INR|Rs\.?|₹)',
@@ -10,21 +162,6 @@ class SMSParser:
         )
         self.fallback_number_pattern = re.compile(r'\b([1-9]\d{2,}(?:\.\d{1,2})?)\b')
 
-        self.merchant_patterns = {
-            'Zomato': re.compile(r'zomato', re.IGNORECASE),
-            'Swiggy': re.compile(r'swiggy', re.IGNORECASE),
-            'Zepto': re.compile(r'zepto', re.IGNORECASE),
-            'Blinkit': re.compile(r'blinkit|grofers', re.IGNORECASE),
-            'Dunzo': re.compile(r'dunzo', re.IGNORECASE),
-            'Uber': re.compile(r'uber', re.IGNORECASE),
-            'Ola': re.compile(r'ola', re.IGNORECASE),
-            'Porter': re.compile(r'porter', re.IGNORECASE),
-            'Rapido': re.compile(r'rapido', re.IGNORECASE),
-            'UrbanCompany': re.compile(r'urban\s*company|urbanclap', re.IGNORECASE),
-            'Amazon': re.compile(r'amazon', re.IGNORECASE), # Flex
-            'Flipkart': re.compile(r'flipkart', re.IGNORECASE), # Delivery
-        }
-
         self.credit_pattern = re.compile(
             r'(credited|received|added|deposited|payout|settlement|salary\s+credit|cashback\s+credited)',
             re.IGNORECASE,
@@ -40,12 +177,13 @@ class SMSParser:
             re.compile(r'\b([A-Za-z]{3,9}\s+\d{1,2},\s*\d{2,4})\b'),
         ]
 
-        # Platforms to explicitly allow (Gig/Work platforms)
-        self.allowed_platforms = {
-            'Zomato', 'Swiggy', 'Zepto', 'Blinkit', 'Dunzo', 
-            'Uber', 'Ola', 'Porter', 'Rapido', 'UrbanCompany',
-            'Amazon', 'Flipkart'
-        }
+        # Triage: reject messages that can never be kept before full parsing
+        self.digit_pattern = re.compile(r'\d')
+
+        # Merchant/platform registry, compiled together with the credit and
+        # debit keywords into one scanner so a message is walked once.
+        self._reload_lock = Lock()
+        self.registry = self.compile_registry(registry if registry is not None else load_registry())
 
     def _extract_amount(self, text):
         amount_match = self.amount_pattern.search(text)
@@ -68,59 +206,191 @@ class SMSParser:
 
         return 0.0
 
+    def compile_registry(self, spec):
+        return CompiledRegistry(spec, self.credit_pattern.pattern, self.debit_pattern.pattern)
+
+    def reload_registry(self, spec=None):
+        """
+        Compile a new registry (from the data file unless a spec is given) and
+        swap it in with a single reference assignment. Batches already running
+        keep the version they started with; a bad file leaves the current one live.
+        """
+        with self._reload_lock:
+            compiled = self.compile_registry(spec if spec is not None else load_registry())
+            self.registry = compiled
+        return compiled
+
+    @property
+    def allowed_platforms(self):
+        return self.registry.allowed
+
+    def triage(self, text, registry=None):
+        """
+        Cheap pre-filter run before full extraction. A message with no digit
+        cannot carry an amount and one without an allowed-platform keyword
+        cannot be kept, so both are rejected without further work.
+        """
+        registry = registry or self.registry
+        return (
+            self.digit_pattern.search(text) is not None
+            and registry.platform_filter.search(text.lower()) is not None
+        )
+
+    def _scan_keywords(self, text, registry=None):
+        """Return (merchant, type) for a message in one pass over the text."""
+        registry = registry or self.registry
+        groups = registry.keyword_groups
+        best_rank = None
+        merchant = "Unknown"
+        has_credit = False
+        has_debit = False
+        for match in registry.keyword_scanner.finditer(text.lower()):
+            if match.group('credit') is not None:
+                has_credit = True
+            if match.group('debit') is not None:
+                has_debit = True
+            group = match.lastgroup
+            if group != 'credit' and group != 'debit':
+                rank, name = groups[group]
+                if best_rank is None or rank < best_rank:
+                    best_rank = rank
+                    merchant = name
+
+        if has_credit:
+            ttype = 'credit'
+        elif has_debit:
+            ttype = 'debit'
+        else:
+            ttype = 'unknown'
+        return merchant, ttype
+
     def _extract_merchant(self, text):
-        for name, pattern in self.merchant_patterns.items():
-            if pattern.search(text):
-                return name
-        return "Unknown"
+        return self._scan_keywords(text)[0]
 
     def _extract_type(self, text):
-        if self.credit_pattern.search(text):
-            return 'credit'
-        if self.debit_pattern.search(text):
-            return 'debit'
-        return 'unknown'
+        return self._scan_keywords(text)[1]
 
-    def _extract_date(self, text):
+    def _extract_date(self, text, today=None):
         for pattern in self.date_patterns:
-            date_match = pattern.search(text)
-            if date_match:
-                return date_match.group(1)
-        return datetime.now().strftime('%Y-%m-%d')
-
-    def _build_description(self, parsed):
-        merchant = parsed['merchant']
-        ttype = parsed['type']
-        amount = parsed['amount']
-        if ttype == 'credit':
-            return f"Credit of Rs {amount:,.2f} from {merchant}"
-        if ttype == 'debit':
-            return f"Debit of Rs {amount:,.2f} to {merchant}"
-        return f"Transaction of Rs {amount:,.2f} involving {merchant}"
-
-    def extract_info(self, text):
-        data = {
-            "amount": 0.0,
-            "merchant": "Unknown",
-            "type": "unknown",  # credit/debit/unknown
-            "date": datetime.now().strftime('%Y-%m-%d'),
-            "description": "",
+            for date_match in pattern.finditer(text):
+                normalized = normalize_date(date_match.group(1))
+                if normalized:
+                    return normalized
+        return today or today_iso()
+
+    def _extract_fields(self, text, today=None, registry=None):
+        """Return (amount, merchant, type, date) for a message without building a dict."""
+        merchant, ttype = self._scan_keywords(text, registry)
+        return self._extract_amount(text), merchant, ttype, self._extract_date(text, today)
+
+    def extract_info(self, text, today=None):
+        """
+        Parse a single message. `today` (ISO date) is used when the message
+        carries no date; batch callers compute it once and pass it in.
+        """
+        amount, merchant, ttype, date = self._extract_fields(text, today)
+        return {
+            "amount": amount,
+            "merchant": merchant,
+            "type": ttype,  # credit/debit/unknown
+            "date": date,
+            "description": describe_transaction(amount, merchant, ttype),
             "raw": text
         }
 
-        data['amount'] = self._extract_amount(text)
-        data['merchant'] = self._extract_merchant(text)
-        data['type'] = self._extract_type(text)
-        data['date'] = self._extract_date(text)
-        data['description'] = self._build_description(data)
-
-        return data
+    def is_relevant(self, info):
+        # Strict filter: known platforms + valid amount.
+        return info['merchant'] in self.allowed_platforms and info['amount'] > 0
 
-    def parse_batch(self, messages):
-        results = []
+    def _iter_kept(self, messages, stats):
+        """Triage, extract and filter messages, yielding (text, amount, merchant, type, date)."""
+        if stats is None:
+            stats = new_batch_stats()
+        today = today_iso()
+        # One registry version for the whole batch, even if a reload lands mid-way
+        registry = self.registry
+        allowed = registry.allowed
         for msg in messages:
-            info = self.extract_info(msg)
-            # Strict filter: known platforms + valid amount.
-            if info['merchant'] in self.allowed_platforms and info['amount'] > 0:
-                results.append(info)
-        return results
+            stats["received"] += 1
+            if not self.triage(msg, registry):
+                stats["triaged_out"] += 1
+                continue
+            stats["parsed"] += 1
+            amount, merchant, ttype, date = self._extract_fields(msg, today, registry)
+            if merchant in allowed and amount > 0:
+                stats["kept"] += 1
+                yield msg, amount, merchant, ttype, date
+
+    def iter_batch(self, messages, stats=None):
+        """
+        Lazily parse any iterable of messages, yielding only relevant transactions.
+        When a stats dict (see new_batch_stats) is given, triage counters are updated in place.
+        """
+        for msg, amount, merchant, ttype, date in self._iter_kept(messages, stats):
+            yield {
+                "amount": amount,
+                "merchant": merchant,
+                "type": ttype,
+                "date": date,
+                "description": describe_transaction(amount, merchant, ttype),
+                "raw": msg
+            }
+
+    def parse_batch(self, messages, stats=None):
+        return list(self.iter_batch(messages, stats))
+
+    def parse_batch_compact(self, messages, stats=None, keep_raw=False):
+        """Like parse_batch, but returns a TransactionBatch instead of a list of dicts."""
+        batch = TransactionBatch(keep_raw)
+        for msg, amount, merchant, ttype, date in self._iter_kept(messages, stats):
+            batch.append(amount, merchant, ttype, date, msg)
+        return batch
+
+    def parse_batch_parallel(self, messages, executor, workers, stats=None, keep_raw=False, min_chunk_size=1000):
+        """
+        Parse a large batch by splitting it across a process pool of `workers`
+        processes (as returned by create_parse_pool). Chunks are mapped in
+        order, so the merged TransactionBatch keeps the input ordering.
+        Per-chunk triage counters are summed into stats when given.
+        """
+        chunk_size = max(min_chunk_size, -(-len(messages) // (workers * 4)))
+        chunks = [messages[i:i + chunk_size] for i in range(0, len(messages), chunk_size)]
+
+        # Ship the registry spec with each chunk so workers follow hot reloads
+        spec = self.registry.spec
+        batch = TransactionBatch(keep_raw)
+        for part, part_stats in executor.map(_parse_chunk, chunks, repeat(keep_raw), repeat(spec)):
+            batch.extend(part)
+            if stats is not None:
+                for key, value in part_stats.items():
+                    stats[key] += value
+        return batch
+
+
+# =================== PROCESS POOL WORKERS ===================
+
+_worker_parser = None
+
+
+def _init_worker():
+    """Build one parser per worker process so patterns compile only once."""
+    global _worker_parser
+    _worker_parser = SMSParser()
+
+
+def _parse_chunk(messages, keep_raw=False, spec=None):
+    if spec is not None and spec != _worker_parser.registry.spec:
+        _worker_parser.reload_registry(spec)
+    stats = new_batch_stats()
+    return _worker_parser.parse_batch_compact(messages, stats, keep_raw), stats
+
+
+def create_parse_pool(workers=None):
+    """
+    Start the process pool used for large SMS batches. Returns (pool, workers);
+    pool is None when only one core is available, since a pool would only add overhead.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers < 2:
+        return None, 1
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker), workers
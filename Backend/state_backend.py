@@ -0,0 +1,431 @@
+"""
+Shared state backends for the API.
+
+Endpoint state (earnings, chat sessions, OTPs, ingestion watermarks) is kept
+in a StateBackend instead of module-level dicts, so several uvicorn workers
+(or hosts) can serve the same users consistently. Pick one with STATE_BACKEND:
+
+    memory                      in-process dicts (default; single worker only)
+    sqlite:///state.db          SQLite in WAL mode, shared by workers on one host
+                                (sqlite:////abs/path.db for an absolute path)
+    redis://host:6379/0         any server speaking the Redis protocol
+
+Values must be JSON-serialisable. Only the memory backend hands back the
+stored object itself, so callers always write a changed value back with set
+(or use transform) rather than mutating what get returned.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+
+_MISSING = object()
+
+
+class StateBackend:
+    """Namespaced key/value store. Subclasses implement the primitives below."""
+
+    name = "base"
+
+    def get(self, namespace, key, default=None):
+        raise NotImplementedError
+
+    def set(self, namespace, key, value):
+        raise NotImplementedError
+
+    def delete(self, namespace, key):
+        raise NotImplementedError
+
+    def clear(self, namespace):
+        raise NotImplementedError
+
+    def lock(self, namespace):
+        """Context manager: exclusive read-modify-write section on a namespace, across workers. Re-entrant."""
+        raise NotImplementedError
+
+    def transform(self, namespace, key, fn, default=None):
+        """Atomically replace the value at key with fn(current) and return it."""
+        with self.lock(namespace):
+            value = fn(self.get(namespace, key, default))
+            self.set(namespace, key, value)
+            return value
+
+    def get_many(self, namespace, keys):
+        """{key: value} for the keys that exist."""
+        found = {}
+        for key in keys:
+            value = self.get(namespace, key, _MISSING)
+            if value is not _MISSING:
+                found[key] = value
+        return found
+
+    def add_missing(self, namespace, values):
+        """
+        Insert every key of values that is not stored yet (insert-if-absent,
+        atomic across workers). Returns the keys this call inserted.
+        """
+        with self.lock(namespace):
+            added = [key for key in values if self.get(namespace, key, _MISSING) is _MISSING]
+            for key in added:
+                self.set(namespace, key, values[key])
+            return added
+
+    def delete_many(self, namespace, keys):
+        for key in keys:
+            self.delete(namespace, key)
+
+    def namespace(self, namespace):
+        return Namespace(self, namespace)
+
+    def close(self):
+        pass
+
+
+class Namespace:
+    """Dict-style view of one namespace, so endpoint code reads like it did with plain dicts."""
+
+    def __init__(self, backend, namespace):
+        self.backend = backend
+        self.name = namespace
+
+    def get(self, key, default=None):
+        return self.backend.get(self.name, key, default)
+
+    def __getitem__(self, key):
+        value = self.backend.get(self.name, key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.backend.set(self.name, key, value)
+
+    def __delitem__(self, key):
+        self.backend.delete(self.name, key)
+
+    def __contains__(self, key):
+        return self.backend.get(self.name, key, _MISSING) is not _MISSING
+
+    def transform(self, key, fn, default=None):
+        return self.backend.transform(self.name, key, fn, default)
+
+    def clear(self):
+        self.backend.clear(self.name)
+
+
+class MemoryBackend(StateBackend):
+    """Plain dicts in this process. Fastest, but every worker has its own copy."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.RLock()
+
+    def get(self, namespace, key, default=None):
+        return self._data.get(namespace, {}).get(key, default)
+
+    def set(self, namespace, key, value):
+        self._data.setdefault(namespace, {})[key] = value
+
+    def delete(self, namespace, key):
+        self._data.get(namespace, {}).pop(key, None)
+
+    def clear(self, namespace):
+        self._data.pop(namespace, None)
+
+    @contextmanager
+    def lock(self, namespace):
+        with self._lock:
+            yield
+
+
+class SQLiteBackend(StateBackend):
+    """
+    One SQLite file in WAL mode. lock() opens a BEGIN IMMEDIATE transaction,
+    which serialises writers across processes. Reads from other threads go
+    through a per-thread connection, so they see the last committed state
+    without waiting for a writer.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+        )
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._owner = None
+        self._readers = threading.local()
+
+    def _read_conn(self):
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._readers.conn = conn
+        return conn
+
+    def get(self, namespace, key, default=None):
+        query = "SELECT value FROM state WHERE namespace = ? AND key = ?"
+        if self._owner == threading.get_ident():
+            # Inside our own write transaction: read its uncommitted changes
+            row = self._conn.execute(query, (namespace, key)).fetchone()
+        else:
+            row = self._read_conn().execute(query, (namespace, key)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, namespace, key, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO state (namespace, key, value) VALUES (?, ?, ?)"
+                " ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value",
+                (namespace, key, json.dumps(value)),
+            )
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def clear(self, namespace):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE namespace = ?", (namespace,))
+
+    def get_many(self, namespace, keys):
+        keys = list(keys)
+        conn = self._conn if self._owner == threading.get_ident() else self._read_conn()
+        found = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = conn.execute(
+                f"SELECT key, value FROM state WHERE namespace = ? AND key IN ({','.join('?' * len(chunk))})",
+                (namespace, *chunk),
+            )
+            found.update((key, json.loads(value)) for key, value in rows)
+        return found
+
+    def add_missing(self, namespace, values):
+        added = []
+        with self.lock(namespace):
+            for key, value in values.items():
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO state (namespace, key, value) VALUES (?, ?, ?)",
+                    (namespace, key, json.dumps(value)),
+                )
+                if cursor.rowcount:
+                    added.append(key)
+        return added
+
+    def delete_many(self, namespace, keys):
+        with self._lock:
+            self._conn.executemany("DELETE FROM state WHERE namespace = ? AND key = ?",
+                                   [(namespace, key) for key in keys])
+
+    @contextmanager
+    def lock(self, namespace):
+        # SQLite locks the whole database, so the namespace only documents intent
+        with self._lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._depth = 1
+            self._owner = threading.get_ident()
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            else:
+                self._conn.execute("COMMIT")
+            finally:
+                self._depth = 0
+                self._owner = None
+
+    def close(self):
+        self._conn.close()
+
+
+class RedisError(Exception):
+    pass
+
+
+def _encode(args):
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg.encode("utf-8") if isinstance(arg, str) else arg
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+class RedisBackend(StateBackend):
+    """
+    Minimal Redis-protocol (RESP2) client: each namespace is a hash, and
+    lock() is a SET NX PX lease. Needs only HGET/HMGET/HSET/HSETNX/HDEL/DEL/
+    GET/SET, so it also works against small stand-ins such as redis_standin.py.
+    """
+
+    name = "redis"
+    LOCK_TTL_MS = 10_000
+
+    def __init__(self, host="localhost", port=6379, db=0, password=None, prefix="arthiksetu:"):
+        self.prefix = prefix
+        self._address = (host, port)
+        self._db = db
+        self._password = password
+        self._sock = None
+        self._io_lock = threading.Lock()
+        self._lock = threading.RLock()
+        self._held = {}
+
+    def _connect(self):
+        self._sock = socket.create_connection(self._address, timeout=10)
+        self._reader = self._sock.makefile("rb")
+        if self._password:
+            self._roundtrip("AUTH", self._password)
+        if self._db:
+            self._roundtrip("SELECT", str(self._db))
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RedisError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            count = int(payload)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    def _roundtrip(self, *args):
+        self._sock.sendall(_encode(args))
+        return self._read_reply()
+
+    def command(self, *args):
+        with self._io_lock:
+            for attempt in (1, 2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._roundtrip(*args)
+                except (OSError, ConnectionError):
+                    self.close()
+                    if attempt == 2:
+                        raise
+
+    def pipeline(self, commands):
+        """Send several commands in one write and return their replies in order. Not retried."""
+        if not commands:
+            return []
+        with self._io_lock:
+            try:
+                if self._sock is None:
+                    self._connect()
+                self._sock.sendall(b"".join(_encode(args) for args in commands))
+                return [self._read_reply() for _ in commands]
+            except (OSError, ConnectionError):
+                self.close()
+                raise
+
+    def get(self, namespace, key, default=None):
+        value = self.command("HGET", self.prefix + namespace, key)
+        return json.loads(value) if value is not None else default
+
+    def set(self, namespace, key, value):
+        self.command("HSET", self.prefix + namespace, key, json.dumps(value))
+
+    def delete(self, namespace, key):
+        self.command("HDEL", self.prefix + namespace, key)
+
+    def clear(self, namespace):
+        self.command("DEL", self.prefix + namespace)
+
+    def get_many(self, namespace, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.command("HMGET", self.prefix + namespace, *keys)
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def add_missing(self, namespace, values):
+        # HSETNX is atomic per field, so concurrent workers never both win a key
+        keys = list(values)
+        replies = self.pipeline([("HSETNX", self.prefix + namespace, key, json.dumps(values[key])) for key in keys])
+        return [key for key, reply in zip(keys, replies) if reply == 1]
+
+    def delete_many(self, namespace, keys):
+        keys = list(keys)
+        if keys:
+            self.command("HDEL", self.prefix + namespace, *keys)
+
+    @contextmanager
+    def lock(self, namespace):
+        with self._lock:
+            if namespace in self._held:
+                yield
+                return
+            lock_key = f"{self.prefix}lock:{namespace}"
+            token = uuid.uuid4().hex
+            delay = 0.002
+            while self.command("SET", lock_key, token, "NX", "PX", str(self.LOCK_TTL_MS)) is None:
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+            self._held[namespace] = token
+            try:
+                yield
+            finally:
+                del self._held[namespace]
+                # Only release our own lease; it may have expired and been taken over
+                if self.command("GET", lock_key) == token:
+                    self.command("DEL", lock_key)
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = None
+
+
+def create_backend(url=None):
+    """Build a backend from a STATE_BACKEND style URL. Raises ValueError for unknown schemes."""
+    url = url or STATE_BACKEND
+    if url == "memory":
+        return MemoryBackend()
+    parsed = urlparse(url)
+    if parsed.scheme == "sqlite":
+        # sqlite:///state.db is relative, sqlite:////var/lib/state.db absolute
+        return SQLiteBackend(parsed.path[1:] or "arthiksetu_state.db")
+    if parsed.scheme == "redis":
+        db = int(parsed.path.lstrip("/") or 0)
+        return RedisBackend(parsed.hostname or "localhost", parsed.port or 6379, db, parsed.password)
+    raise ValueError(f"Unknown STATE_BACKEND: {url}")
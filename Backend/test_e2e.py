@@ -8,6 +8,7 @@ import requests
 import json
 import sys
 import os
+import secrets
 
 BASE = "http://localhost:8000"
 
@@ -45,6 +46,67 @@ def test_dashboard():
     _ok("GET /api/dashboard")
 
 
+# ─── 2b. Dashboard pagination and sparse fields ──────────────────────
+def test_dashboard_pagination():
+    first = requests.get(f"{BASE}/api/dashboard").json()
+    # Without limit only the default page (50) comes back
+    assert len(first["incomeSources"]) == min(50, first["totalSources"])
+    assert (first["nextCursor"] is not None) == (first["totalSources"] > 50)
+    full = requests.get(f"{BASE}/api/dashboard", params={"limit": 200}).json()["incomeSources"]
+    names, cursor = [], None
+    while True:
+        params = {"limit": 1, "fields": "name,amount"}
+        if cursor:
+            params["cursor"] = cursor
+        r = requests.get(f"{BASE}/api/dashboard", params=params)
+        assert r.status_code == 200
+        d = r.json()
+        assert len(d["incomeSources"]) <= 1
+        assert all(set(s) <= {"name", "amount"} for s in d["incomeSources"])
+        names += [s["name"] for s in d["incomeSources"]]
+        cursor = d["nextCursor"]
+        if not cursor:
+            break
+    assert names == [s["name"] for s in full]
+    r = requests.get(f"{BASE}/api/dashboard", params={"cursor": "not-a-cursor"})
+    assert r.status_code == 400
+    _ok("GET /api/dashboard — default page, cursor pagination and fields")
+
+
+# ─── 2c. Conditional GET with ETag ───────────────────────────────────
+def test_etag_not_modified():
+    for path in ("/api/dashboard", "/api/loans", "/api/tax_calculation", "/api/export_earnings"):
+        r = requests.get(f"{BASE}{path}")
+        assert r.status_code == 200
+        etag = r.headers["ETag"]
+        r = requests.get(f"{BASE}{path}", headers={"If-None-Match": etag})
+        assert r.status_code == 304 and r.content == b""
+    before = requests.get(f"{BASE}/api/dashboard").headers["ETag"]
+    requests.post(f"{BASE}/api/add_income", data={"name": "ETag Check", "amount": 1})
+    r = requests.get(f"{BASE}/api/dashboard", headers={"If-None-Match": before})
+    assert r.status_code == 200 and r.headers["ETag"] != before
+    _ok("GET read endpoints — ETag / 304 Not Modified")
+
+
+# ─── 2d. Dashboard delta sync ────────────────────────────────────────
+def test_dashboard_delta():
+    d = requests.get(f"{BASE}/api/dashboard").json()
+    version = d["version"]
+    requests.post(f"{BASE}/api/add_income", data={"name": "Delta Check", "amount": 42})
+    r = requests.get(f"{BASE}/api/dashboard", params={"since": version})
+    assert r.status_code == 200
+    delta = r.json()
+    assert delta["full"] is False and delta["version"] != version
+    assert [s["name"] for s in delta["changedSources"]] == ["Delta Check"]
+    assert delta["removedSourceIds"] == []
+    assert delta["totalMonthlyIncome"] == d["totalMonthlyIncome"] + 42
+    r = requests.get(f"{BASE}/api/dashboard", params={"since": version, "fields": "amount"})
+    assert [set(s) for s in r.json()["changedSources"]] == [{"id", "amount"}]
+    r = requests.get(f"{BASE}/api/dashboard", params={"since": "stale-1"})
+    assert r.json()["full"] is True and "incomeSources" in r.json()
+    _ok("GET /api/dashboard?since= — delta sync")
+
+
 # ─── 3. SMS Parsing ───────────────────────────────────────────────────
 def test_parse_sms():
     payload = {
@@ -62,6 +124,73 @@ def test_parse_sms():
     _ok("POST /api/parse_sms")
 
 
+# ─── 3b. Streaming SMS Parsing ────────────────────────────────────────
+def test_parse_sms_stream():
+    body = "\n".join([
+        "Rs 2,350 credited to your a/c XX1234 on 14-Jan-24 by UBER PAYOUT.",
+        json.dumps("Your UPI transaction to Zepto\nfor Rs.275 is successful"),
+        "Your OTP is 482913. Do not share it with anyone.",
+    ])
+    r = requests.post(f"{BASE}/api/parse_sms_stream", data=body.encode("utf-8"))
+    assert r.status_code == 200
+    records = [json.loads(line) for line in r.text.splitlines() if line]
+    assert "summary" in records[-1]
+    assert records[-1]["summary"]["received"] == 3
+    assert records[-1]["summary"]["count"] == len(records) - 1 == 2
+    _ok("POST /api/parse_sms_stream")
+
+
+# ─── 3c. Re-sent SMS are not counted twice ───────────────────────────
+def test_parse_sms_dedup():
+    ref = secrets.token_hex(4)
+    payload = {"messages": [f"Rs 800 credited by Porter payout. Ref {ref}"]}
+    first = requests.post(f"{BASE}/api/parse_sms", json=payload).json()
+    total_before = requests.get(f"{BASE}/api/dashboard").json()["totalMonthlyIncome"]
+    second = requests.post(f"{BASE}/api/parse_sms", json=payload).json()
+    total_after = requests.get(f"{BASE}/api/dashboard").json()["totalMonthlyIncome"]
+    assert first["summary"]["count"] == 1
+    assert second["summary"]["count"] == 0
+    assert second["summary"]["duplicates_skipped"] == 1
+    assert total_before == total_after
+    # The same notice received by another user is that user's income
+    other = requests.post(f"{BASE}/api/parse_sms", json={**payload, "user_id": f"e2e-{ref}"}).json()
+    assert other["summary"]["count"] == 1
+    assert other["summary"]["duplicates_skipped"] == 0
+    _ok("POST /api/parse_sms — duplicate SMS skipped")
+
+
+# ─── 3d. Incremental sync watermark ──────────────────────────────────
+def test_sms_watermark():
+    user = f"e2e-{secrets.token_hex(4)}"
+    first = requests.post(f"{BASE}/api/parse_sms", json={
+        "user_id": user,
+        "messages": [f"Rs 300 credited by Rapido payout {user} a", f"Rs 310 credited by Rapido payout {user} b"],
+        "message_ids": [100, 200],
+    }).json()
+    assert first["watermark"] == 200
+    second = requests.post(f"{BASE}/api/parse_sms", json={
+        "user_id": user,
+        "messages": [f"Rs 320 credited by Rapido payout {user} c", f"Rs 330 credited by Rapido payout {user} d"],
+        "message_ids": [150, 250],
+    }).json()
+    assert second["summary"]["stale_skipped"] == 1
+    assert second["summary"]["count"] == 1
+    r = requests.get(f"{BASE}/api/sms_watermark", params={"user_id": user})
+    assert r.status_code == 200
+    assert r.json()["watermark"] == 250
+    _ok("POST /api/parse_sms — watermark drops already-synced SMS")
+
+
+# ─── 3e. Platform registry hot reload ────────────────────────────────
+def test_reload_platforms():
+    r = requests.post(f"{BASE}/api/reload_platforms")
+    assert r.status_code == 200
+    d = r.json()
+    assert d["status"] == "reloaded"
+    assert d["platform_count"] >= d["allowed_count"] > 0
+    _ok("POST /api/reload_platforms")
+
+
 # ─── 4. Chat ──────────────────────────────────────────────────────────
 def test_chat():
     payload = {"message": "How can I save more?", "session_id": "test_e2e"}
@@ -102,6 +231,18 @@ def test_decode_message():
     _ok("POST /api/decode_message")
 
 
+# ─── 6b. AI call pool metrics ────────────────────────────────────────
+def test_ai_metrics():
+    r = requests.get(f"{BASE}/api/ai_metrics")
+    assert r.status_code == 200
+    d = r.json()
+    assert d["max_concurrency"] >= 1
+    assert d["queue_depth"] >= 0 and d["running"] <= d["max_concurrency"]
+    assert {"hits", "misses", "entries", "bytes"} <= set(d["cache"])
+    assert all("state" in k and "tokens" in k for k in d["api_keys"]["keys"])
+    _ok("GET /api/ai_metrics")
+
+
 # ─── 7. Unified dashboard ────────────────────────────────────────────
 def test_unified_dashboard():
     payload = {
@@ -258,6 +399,56 @@ def test_add_and_clear_income():
     _ok("DELETE /api/clear_income")
 
 
+# ─── 21b. Earnings time series ───────────────────────────────────────
+def test_earnings_series():
+    r = requests.get(f"{BASE}/api/earnings_series", params={"granularity": "month", "start": "2024-01"})
+    assert r.status_code == 200
+    d = r.json()
+    assert all(p["period"] >= "2024-01" for p in d["points"])
+    assert d["total"] == sum(p["amount"] for p in d["points"])
+    r = requests.get(f"{BASE}/api/earnings_series", params={"granularity": "week"})
+    assert r.status_code == 400
+    _ok("GET /api/earnings_series")
+
+
+# ─── 21c. Earnings event log stats ───────────────────────────────────
+def test_earnings_log_stats():
+    r = requests.get(f"{BASE}/api/earnings_log_stats")
+    assert r.status_code == 200
+    d = r.json()
+    assert "enabled" in d
+    if d["enabled"]:
+        assert d["durable_seq"] <= d["last_seq"]
+        assert "total_seconds" in d["restore"] or d["restore"]["replayed_events"] == 0
+    _ok("GET /api/earnings_log_stats")
+
+
+# ─── 21d. Earnings range aggregation ─────────────────────────────────
+def test_earnings_range():
+    user = f"range-{secrets.token_hex(4)}"
+    tag = secrets.randbelow(10**9)
+    messages = [
+        f"Rs 1,000 credited to your a/c on 03-Feb-25 by ZOMATO PAYOUT ref {tag}1",
+        f"Rs 500 credited to your a/c on 04-Feb-25 by ZOMATO PAYOUT ref {tag}2",
+        f"Rs 700 credited to your a/c on 10-Mar-25 by SWIGGY PAYOUT ref {tag}3",
+    ]
+    r = requests.post(f"{BASE}/api/parse_sms", json={"messages": messages, "user_id": user})
+    assert r.status_code == 200
+    r = requests.get(f"{BASE}/api/earnings_range",
+                     params={"user_id": user, "start": "2025-02-01", "end": "2025-02-28", "group_by": "day"})
+    assert r.status_code == 200
+    d = r.json()
+    assert d["count"] == 2 and d["sum"] == 1500
+    assert [b["key"] for b in d["buckets"]] == ["2025-02-03", "2025-02-04"]
+    r = requests.get(f"{BASE}/api/earnings_range", params={"user_id": user, "group_by": "month"})
+    assert [(b["key"], b["sum"]) for b in r.json()["buckets"]] == [("2025-02", 1500), ("2025-03", 700)]
+    r = requests.get(f"{BASE}/api/earnings_range", params={"user_id": user, "group_by": "year"})
+    assert r.status_code == 400
+    r = requests.get(f"{BASE}/api/earnings_range", params={"user_id": user, "start": "2025-03-01", "end": "2025-01-01"})
+    assert r.status_code == 400
+    _ok("GET /api/earnings_range")
+
+
 # ─── 22. Document verify — no file (expect 422) ──────────────────────
 def test_verify_document_no_file():
     r = requests.post(f"{BASE}/api/verify_document")
@@ -270,10 +461,18 @@ def test_verify_document_no_file():
 ALL_TESTS = [
     test_root,
     test_dashboard,
+    test_dashboard_pagination,
+    test_etag_not_modified,
+    test_dashboard_delta,
     test_parse_sms,
+    test_parse_sms_stream,
+    test_parse_sms_dedup,
+    test_sms_watermark,
+    test_reload_platforms,
     test_chat,
     test_predict_risk,
     test_decode_message,
+    test_ai_metrics,
     test_unified_dashboard,
     test_simplify_scheme,
     test_recommend_schemes,
@@ -289,6 +488,9 @@ ALL_TESTS = [
     test_privacy_settings,
     test_delete_all_data,
     test_add_and_clear_income,
+    test_earnings_series,
+    test_earnings_log_stats,
+    test_earnings_range,
     test_verify_document_no_file,
 ]
 
@@ -0,0 +1,429 @@
+"""
+ArthikSetu — Unit Tests
+Tests the parser, registry and store modules directly, no server needed.
+Run:  python test_unit.py   (or: python -m pytest test_unit.py)
+"""
+
+import random
+import re
+import sys
+
+results = {"passed": 0, "failed": 0, "errors": []}
+
+
+def _ok(name):
+    results["passed"] += 1
+    print(f"  [PASS] {name}")
+
+
+def _fail(name, detail=""):
+    results["failed"] += 1
+    results["errors"].append(f"{name}: {detail}")
+    print(f"  [FAIL] {name} — {detail}")
+
+
+# ─── 1. Keyword scanner matches the per-keyword loop it replaced ─────
+def _scan_per_keyword(parser, spec, text):
+    """The pre-trie lookup: one regex per platform in priority order, then credit/debit."""
+    merchant = "Unknown"
+    for entry in spec["platforms"]:
+        sources = [r'\s*'.join(map(re.escape, a.split())) for a in entry.get("aliases", [])]
+        sources += [rf'\b{re.escape(s)}\b' for s in entry.get("sender_ids", [])]
+        if re.search('|'.join(sources), text, re.IGNORECASE):
+            merchant = entry["name"]
+            break
+    if parser.credit_pattern.search(text):
+        return merchant, 'credit'
+    if parser.debit_pattern.search(text):
+        return merchant, 'debit'
+    return merchant, 'unknown'
+
+
+def test_scanner_matches_per_keyword_loop():
+    from platform_registry import load_registry
+    from sms_parser import SMSParser
+    spec = load_registry()
+    parser = SMSParser(registry=spec)
+    keywords = [a for p in spec["platforms"] for a in p.get("aliases", [])]
+    keywords += [s for p in spec["platforms"] for s in p.get("sender_ids", [])]
+    words = keywords + [
+        "credited", "received", "payout", "salary credit", "debited", "paid", "dr", "drive",
+        "sent", "upi transaction to", "Rs 450.00", "INR 1,200", "on", "your", "a/c", "XX1234",
+        "cola", "Uberization", "urbancompany", "AMAZON PAY", "12-Jan-24",
+    ]
+    rng = random.Random(7)
+    corpus = [" ".join(rng.choice(words) for _ in range(rng.randint(1, 9))) for _ in range(3000)]
+    corpus += ["Rs 500 received via Amazon Pay", "Your Ola ride paid", "Nothing to see here"]
+    for text in corpus:
+        assert parser._scan_keywords(text) == _scan_per_keyword(parser, spec, text), text
+    _ok("Keyword scanner — same (merchant, type) as the per-keyword loop")
+
+
+# ─── 2. Merchant priority when one alias is a prefix of another ─────
+def test_platform_alias_priority():
+    from sms_parser import SMSParser
+    spec = {"platforms": [
+        {"name": "Amazon", "aliases": ["amazon"]},
+        {"name": "AmazonPay", "aliases": ["amazon pay"]},
+        {"name": "Payday", "aliases": ["paid out"]},
+    ]}
+    parser = SMSParser(registry=spec)
+    assert parser._scan_keywords("Rs 500 received via Amazon Pay") == ("Amazon", "credit")
+    # Reversed priority: the longer alias wins
+    spec["platforms"][:2] = spec["platforms"][1::-1]
+    assert SMSParser(registry=spec)._scan_keywords("Rs 500 received via Amazon Pay")[0] == "AmazonPay"
+    # A debit keyword starting where an alias starts is still seen
+    assert parser._scan_keywords("Rs 200 paid out by Payday") == ("Payday", "debit")
+    _ok("Platform registry — prefix aliases keep priority")
+
+
+# ─── 3. Memoized date normalisation across formats ──────────────────
+def test_normalize_date_cache():
+    from sms_parser import SMSParser, normalize_date
+    cases = {
+        "12-Jan-24": "2024-01-12",
+        "12/Jan/2024": "2024-01-12",
+        "05/03/2024": "2024-03-05",      # day first
+        "5-3-24": "2024-03-05",
+        "Jan 12, 2024": "2024-01-12",
+        "September 9, 24": "2024-09-09",
+        "31/02/2024": None,              # not a real date
+        "12-Foo-24": None,
+        "12/01/202": None,
+    }
+    normalize_date.cache_clear()
+    for _ in range(3):
+        for token, expected in cases.items():
+            assert normalize_date(token) == expected, token
+            assert normalize_date.__wrapped__(token) == expected, token
+    info = normalize_date.cache_info()
+    assert info.misses == len(cases) and info.hits == 2 * len(cases)
+
+    # An invalid token falls through to the next date in the message
+    parser = SMSParser()
+    assert parser._extract_date("Rs 500 on 31/02/2024, ref 05/03/2024", today="2000-01-01") == "2024-03-05"
+    assert parser._extract_date("Rs 500 credited", today="2000-01-01") == "2000-01-01"
+    _ok("normalize_date — formats, invalid dates, cache hits")
+
+
+# ─── 4. Columnar batch round-trips to the classic dicts ─────────────
+def test_transaction_batch_round_trip():
+    from sms_parser import SMSParser, TransactionBatch
+    messages = [
+        "Rs 450.00 credited to your a/c by Zomato on 12-Jan-24",
+        "INR 1,200 received from Swiggy payout 05/03/2024",
+        "Rs 300 paid to Uber on 06/03/2024",
+        "Your Zomato order of Rs 250 has been delivered",
+        "Hello, no amount in this one",
+        "Rs 99.50 credited by Zomato on 12-Jan-24",
+    ] * 3
+    parser = SMSParser()
+    expected = parser.parse_batch(messages)
+    for keep_raw in (False, True):
+        batch = parser.parse_batch_compact(messages, keep_raw=keep_raw)
+        assert len(batch) == len(expected)
+        assert batch.to_dicts(include_raw=True) == [
+            {k: v for k, v in row.items() if keep_raw or k != "raw"} for row in expected
+        ]
+        assert batch.merchants == ["Zomato", "Swiggy", "Uber"]      # interned once each
+        for ttype in ("credit", "debit", "unknown"):
+            assert batch.total(ttype) == sum(r["amount"] for r in expected if r["type"] == ttype)
+
+    # extend() remaps the other batch's dictionaries onto this one
+    head, tail = parser.parse_batch_compact(messages[:6]), parser.parse_batch_compact(messages[3:])
+    head.extend(tail)
+    assert head.to_dicts() == [{k: v for k, v in r.items() if k != "raw"}
+                               for r in parser.parse_batch(messages[:6] + messages[3:])]
+    assert len(head.merchants) == len(set(head.merchants))
+    assert TransactionBatch().to_dicts() == [] and TransactionBatch().total("credit") == 0
+    _ok("TransactionBatch — to_dicts / total / extend round-trip")
+
+
+# ─── 4b. Process pool parsing matches inline parsing ────────────────
+def test_parse_batch_parallel():
+    from sms_parser import SMSParser, create_parse_pool, new_batch_stats
+    messages = [f"Rs {100 + i} credited by {('Zomato', 'Swiggy', 'Uber')[i % 3]} on 0{1 + i % 9}/03/2024"
+                for i in range(2500)] + ["no digits here"] * 500
+    parser = SMSParser()
+    pool, workers = create_parse_pool(2)
+    assert workers == 2 and create_parse_pool(1) == (None, 1)
+    try:
+        stats, parallel_stats = new_batch_stats(), new_batch_stats()
+        inline = parser.parse_batch_compact(messages, stats)
+        parallel = parser.parse_batch_parallel(messages, pool, workers, parallel_stats, min_chunk_size=300)
+    finally:
+        pool.shutdown()
+    assert parallel.to_dicts() == inline.to_dicts() and parallel_stats == stats
+    _ok("parse_batch_parallel — same batch and stats as inline parsing")
+
+
+# ─── 5. Event log restore: snapshot + tail, torn last line ──────────
+def _store_doc(store):
+    return {k: v for k, v in store.snapshot().doc().items() if not k.startswith("changes")}
+
+
+def test_event_log_restore_torn_tail():
+    import os
+    import tempfile
+    from earnings_log import EarningsEventLog, SEGMENT_PREFIX
+    from earnings_store import EarningsStore
+
+    with tempfile.TemporaryDirectory() as directory:
+        log = EarningsEventLog(directory, fsync_interval_ms=1, snapshot_every=20)
+        store = EarningsStore(income_sources=[{"name": "Seed", "amount": 10, "source": "Seed"}],
+                              event_log=log, debug=True)
+        for i in range(53):
+            store.add_to_source(f"P{i % 4}", 2.5, source="SMS", upload_time="2025-03-01T00:00:00")
+        store.add_source({"name": "Manual", "amount": 7, "source": "Manual"})
+        log.sync()
+        expected = _store_doc(store)
+        log.close()
+
+        # Crash mid-write: half a line at the end of the newest segment
+        segment = max(n for n in os.listdir(directory) if n.startswith(SEGMENT_PREFIX))
+        with open(os.path.join(directory, segment), "a", encoding="utf-8") as f:
+            f.write('{"seq":999,"op":"add_to_sou')
+
+        # The seed is ignored once there is something to restore
+        log = EarningsEventLog(directory)
+        store = EarningsStore(income_sources=[{"name": "Other", "amount": 1}], event_log=log, debug=True)
+        assert log.restore_stats["snapshot_seq"] > 0
+        assert 0 < log.restore_stats["replayed_events"] < 20
+        assert _store_doc(store) == expected
+        assert store.get_total_monthly_income() == 10 + 53 * 2.5 + 7
+
+        # Writing continues in a fresh segment, past the torn one
+        store.add_source({"name": "After", "amount": 5, "source": "Manual"})
+        expected = _store_doc(store)
+        log.close()
+        log = EarningsEventLog(directory)
+        store = EarningsStore(event_log=log)
+        assert _store_doc(store) == expected
+        log.close()
+    _ok("EarningsEventLog — snapshot + tail restore ignores a torn line")
+
+
+# ─── 6. Ring series: wraparound, eviction, late writes ──────────────
+def test_ring_series_wraparound():
+    from earnings_series import RingSeries, month_ordinal, month_period
+
+    ring = RingSeries(4)
+    assert ring.latest(3) == [] and ring.range(0, 100) == []
+    for ordinal in range(10, 16):
+        ring.add(ordinal, 1.0, "Zomato")
+        ring.add(ordinal, 2.0, "Swiggy")
+    assert ring.head == 15
+    assert ring.get(10) is None and ring.get(11) is None            # evicted by 14, 15
+    assert ring.get(12) == (3.0, {"Zomato": 1.0, "Swiggy": 2.0})
+    assert [o for o, _, _ in ring.range(0, 100)] == [12, 13, 14, 15]
+    assert [o for o, _, _ in ring.latest(2)] == [14, 15]
+
+    # A period older than the window is dropped, not written over a newer slot
+    ring.add(11, 50.0)
+    ring.set(8, 50.0)
+    assert ring.get(15)[0] == 3.0 and ring.get(12)[0] == 3.0
+
+    # Jumping ahead leaves a gap; stale slots are not reported as the new periods
+    ring.add(18, 4.0)
+    assert [o for o, _, _ in ring.range(0, 100)] == [15, 18]
+    assert ring.get(16) is None and ring.get(17) is None
+
+    # copy() never shares a slot that a later write changes
+    clone = ring.copy()
+    ring.add(18, 1.0, "Zomato")
+    assert clone.get(18) == (4.0, {}) and ring.get(18) == (5.0, {"Zomato": 1.0})
+
+    # JSON round-trip; a smaller capacity keeps the newest periods
+    assert RingSeries.from_json(ring.to_json()).range(0, 100) == ring.range(0, 100)
+    assert [o for o, _, _ in RingSeries.from_json(ring.to_json(), capacity=1).range(0, 100)] == [18]
+
+    # Month ordinals wrap across the year boundary
+    assert month_period(month_ordinal("2024-12") + 1) == "2025-01"
+    _ok("RingSeries — wraparound, eviction, late writes, copy, JSON")
+
+
+# ─── 7. Ledger rows survive a restart with the earnings ─────────────
+def test_ledger_restart_matches_store():
+    import tempfile
+    from earnings_log import EarningsEventLog
+    from earnings_store import EarningsStore
+    from sms_parser import SMSParser
+    from state_backend import MemoryBackend
+    from transaction_ledger import TransactionLedgers, batch_rows, day_of
+
+    def open_store(directory):
+        log = EarningsEventLog(directory, fsync_interval_ms=1, snapshot_every=5)
+        ledgers = TransactionLedgers(MemoryBackend())
+        return log, ledgers, EarningsStore(event_log=log, ledgers=ledgers)
+
+    def range_total(ledgers):
+        return ledgers.get("default").aggregate(day_of("2000-01-01"), day_of("2100-01-01"))[1]["sum"]
+
+    parser = SMSParser()
+    with tempfile.TemporaryDirectory() as directory:
+        log, ledgers, store = open_store(directory)
+        with store.transaction() as txn:
+            txn.add_source({"name": "Old", "amount": 40, "source": "Manual"})
+            txn.record_ledger("default", {"days": [day_of("2024-06-01")], "amounts": [40.0],
+                                          "merchants": ["Old"], "types": ["credit"]})
+        store.clear()
+        assert range_total(ledgers) == 0
+        for i in range(12):
+            batch = parser.parse_batch_compact([f"Rs {100 + i} credited by Zomato on 0{1 + i % 9}/03/2024",
+                                                "Rs 30 paid to Uber on 02/03/2024"])
+            with store.transaction() as txn:
+                txn.record_ledger("default", batch_rows(batch))
+                for j in range(len(batch)):
+                    if batch.type(j) == "credit":
+                        txn.add_to_source(batch.merchant(j), batch.amounts[j], source="SMS")
+        expected = store.get_total_monthly_income()
+        assert range_total(ledgers) == expected == sum(100 + i for i in range(12))
+        log.close()
+
+        log, ledgers, store = open_store(directory)
+        assert log.restore_stats["snapshot_seq"] > 0 and log.restore_stats["replayed_events"] > 0
+        assert store.get_total_monthly_income() == expected
+        assert range_total(ledgers) == expected
+        debit = ledgers.get("default").aggregate(day_of("2024-03-01"), day_of("2024-03-31"), ttype="debit")[1]
+        assert debit["count"] == 12 and debit["sum"] == 360
+        log.close()
+    _ok("TransactionLedgers — range totals match the store after a restart")
+
+
+# ─── 8. Copy-on-write drafts leave published snapshots untouched ────
+def test_copy_on_write_snapshots():
+    from earnings_store import EarningsStore
+    from paged_collections import PagedDict, PagedList
+
+    items = PagedList(range(1000), page_size=64)
+    clone = items.copy()
+    clone[5] = -5
+    clone.append(1000)
+    assert items[5] == 5 and len(items) == 1000 and clone[995:] == [995, 996, 997, 998, 999, 1000]
+    assert sum(1 for a, b in zip(items.pages, clone.pages) if a is not b) == 2   # only the written pages
+    assert items[-1] == 999 and items[10:12] == [10, 11] and list(clone)[5] == -5
+
+    totals = PagedDict({f"k{i}": i for i in range(5000)}, default=float)
+    clone = totals.copy()
+    clone["k7"] += 1
+    clone["new"] += 2.5
+    del clone["k8"]
+    assert totals["k7"] == 7 and "new" not in totals and totals["k8"] == 8 and totals["missing"] == 0.0
+    assert clone["k7"] == 8 and clone["new"] == 2.5 and "k8" not in clone and len(clone) == len(totals)
+    assert dict(clone) == {**{f"k{i}": i for i in range(5000) if i != 8}, "k7": 8, "new": 2.5}
+
+    store = EarningsStore(income_sources=[{"name": f"S{i}", "amount": 1, "source": "Seed"} for i in range(600)],
+                          debug=True)
+    before = store.snapshot()
+    doc = before.doc()
+    store.add_to_source("S3", 4, source="SMS")
+    store.add_source({"name": "New", "amount": 2, "source": "Manual"})
+    store.clear()
+    assert before.doc() == doc and before.find_source("S3")["amount"] == 1 and before.total == 600
+    assert store.get_total_monthly_income() == 0 and len(store.income_sources) == 0
+    _ok("Paged collections — copy-on-write drafts keep snapshots stable")
+
+
+# ─── 9. Gemini key pool: least loaded, cooldown, half-open ──────────
+def test_key_pool():
+    import key_pool
+    from google.api_core.exceptions import DeadlineExceeded, ResourceExhausted, ServiceUnavailable, Unauthenticated
+
+    class Clock:
+        now = 1000.0
+
+        def monotonic(self):
+            return self.now
+
+        def sleep(self, seconds):
+            self.now += seconds
+
+    clock = Clock()
+    real_time, key_pool.time = key_pool.time, clock
+    try:
+        pool = key_pool.KeyPool([("key-a", 60), ("key-b", 60)], burst=2, cooldown_s=10, circuit_s=100)
+        a, b = pool.keys
+        la, lb = pool.acquire(), pool.acquire()
+        assert (la.key, lb.key) == ("key-a", "key-b")   # least loaded
+        assert pool.release(lb, Unauthenticated("bad key")) is True
+        assert b.state == key_pool.OPEN
+        assert pool.release(la, ResourceExhausted("quota")) is True
+        assert a.cooldown_until - clock.now == 10
+        assert not key_pool.is_auth_error(RuntimeError("read 403 bytes"))
+        # Waits out the cooldown; a second 429 in a row doubles it
+        la = pool.acquire()
+        assert la.key == "key-a" and clock.now == 1010
+        pool.release(la, ResourceExhausted("quota"))
+        assert a.cooldown_until - clock.now == 20
+        # After circuit_s the open key gets one trial call at a time
+        clock.now += 100
+        la = pool.acquire()
+        trial = pool.acquire()
+        assert trial.key == "key-b" and b.state == key_pool.HALF_OPEN
+        assert not b.usable(clock.now)
+        pool.abandon(trial)                              # cancelled: still half-open
+        assert b.state == key_pool.HALF_OPEN and b.usable(clock.now)
+        trial = pool.acquire()
+        assert trial.key == "key-b"
+        pool.release(trial)
+        pool.release(la)
+        assert b.state == key_pool.CLOSED and a.in_flight == b.in_flight == 0
+        # Local errors say nothing about the key; server errors open it at the threshold
+        errors = b.errors
+        for _ in range(pool.failure_threshold + 1):
+            assert pool.release(pool.acquire(), ValueError("bad prompt")) is False
+        assert b.state == key_pool.CLOSED and b.failures == 0 and b.errors == errors
+        for error in [ServiceUnavailable("503")] * (pool.failure_threshold - 1) + [DeadlineExceeded("slow")]:
+            lb = pool.acquire()
+            while lb.key != "key-b":
+                pool.release(lb)
+                lb = pool.acquire()
+            assert pool.release(lb, error) is False
+        assert b.state == key_pool.OPEN and b.errors == errors + pool.failure_threshold
+    finally:
+        key_pool.time = real_time
+    _ok("KeyPool — least loaded, cooldown doubling, half-open trial, server errors only")
+
+
+ALL_TESTS = [
+    test_scanner_matches_per_keyword_loop,
+    test_platform_alias_priority,
+    test_normalize_date_cache,
+    test_transaction_batch_round_trip,
+    test_parse_batch_parallel,
+    test_event_log_restore_torn_tail,
+    test_ring_series_wraparound,
+    test_ledger_restart_matches_store,
+    test_copy_on_write_snapshots,
+    test_key_pool,
+]
+
+
+def main():
+    print("=" * 60)
+    print("  ArthikSetu — Unit Test Suite")
+    print("=" * 60)
+    print()
+
+    for test_fn in ALL_TESTS:
+        try:
+            test_fn()
+        except AssertionError as e:
+            _fail(test_fn.__name__, str(e))
+        except Exception as e:
+            _fail(test_fn.__name__, f"Exception: {e}")
+
+    print()
+    print("-" * 60)
+    total = results["passed"] + results["failed"]
+    print(f"  Results: {results['passed']}/{total} passed, {results['failed']} failed")
+    if results["errors"]:
+        print()
+        for err in results["errors"]:
+            print(f"  ✗ {err}")
+    print("-" * 60)
+    return 0 if results["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,326 @@
+"""
+Per-user ledger of individual SMS/manual transactions, for range queries.
+
+Rows are stored column-wise (day ordinal, amount, merchant id, type code)
+in compact arrays, about 17 bytes each. Queries work on a time-sorted
+numpy view with prefix sums of the amounts: the range is found with a
+binary search (searchsorted), each bucket's sum is a difference of two
+prefix sums, and min/max come from one reduceat pass over just the range.
+A per-merchant view, built on first use, serves platform-filtered queries
+the same way. Views are rebuilt lazily after appends; rows that arrive in
+time order are merged onto the existing view without a full re-sort.
+"""
+
+import threading
+from array import array
+from datetime import date
+
+import numpy as np
+
+from sms_parser import TYPE_CODES
+
+_TYPE_INDEX = {name: code for code, name in enumerate(TYPE_CODES)}
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+GROUPINGS = ("day", "week", "month", "platform")
+
+
+def day_of(iso_date):
+    """'2025-02-01' (or a full ISO timestamp) -> date ordinal."""
+    return date.fromisoformat(iso_date[:10]).toordinal()
+
+
+def batch_rows(batch):
+    """
+    The credits and debits of a TransactionBatch as ledger rows: plain lists
+    (JSON-ready, so they can ride along in an earnings log event), decoding
+    the batch's dictionaries once.
+    """
+    if not len(batch):
+        return {"days": [], "amounts": [], "merchants": [], "types": []}
+    types = np.frombuffer(batch.type_codes, dtype=np.int8)
+    keep = types != _TYPE_INDEX['unknown']
+    date_map = np.array([day_of(d) for d in batch.dates], dtype=np.int32)
+    merchant_ids = np.frombuffer(batch.merchant_ids, dtype=np.uint16)[keep].tolist()
+    return {
+        "days": date_map[np.frombuffer(batch.date_ids, dtype=np.uint32)][keep].tolist(),
+        "amounts": np.frombuffer(batch.amounts, dtype=np.float64)[keep].tolist(),
+        "merchants": [batch.merchants[m] for m in merchant_ids],
+        "types": [TYPE_CODES[t] for t in types[keep].tolist()],
+    }
+
+
+class _View:
+    """Time-sorted numpy columns with a prefix sum over amounts."""
+
+    __slots__ = ("days", "amounts", "merchants", "prefix")
+
+    def __init__(self, days, amounts, merchants):
+        self.days = days
+        self.amounts = amounts
+        self.merchants = merchants
+        self.prefix = np.concatenate(([0.0], np.cumsum(amounts)))
+
+    def bounds(self, start, end):
+        return (int(np.searchsorted(self.days, start, "left")),
+                int(np.searchsorted(self.days, end, "right")))
+
+
+class TransactionLedger:
+    """Append-only columnar ledger for one user."""
+
+    def __init__(self):
+        self.days = array('i')
+        self.amounts = array('d')
+        self.merchant_ids = array('I')
+        self.type_codes = array('b')
+        self.merchants = []
+        self._merchant_index = {}
+        self._lock = threading.Lock()
+        self._views = {}          # type code -> _View, (type code, merchant id) -> _View
+        self._indexed = {}        # type code -> rows covered by that view
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def _intern(self, merchant):
+        mid = self._merchant_index.get(merchant)
+        if mid is None:
+            mid = self._merchant_index[merchant] = len(self.merchants)
+            self.merchants.append(merchant)
+        return mid
+
+    def append(self, day, amount, merchant, ttype):
+        with self._lock:
+            self.days.append(day)
+            self.amounts.append(amount)
+            self.merchant_ids.append(self._intern(merchant))
+            self.type_codes.append(_TYPE_INDEX[ttype])
+
+    def extend_rows(self, days, amounts, merchants, types):
+        with self._lock:
+            self.days.extend(days)
+            self.amounts.extend(amounts)
+            self.merchant_ids.extend(self._intern(m) for m in merchants)
+            self.type_codes.extend(_TYPE_INDEX[t] for t in types)
+
+    def rows_since(self, start):
+        """Rows appended at or after position start, as plain lists (for syncing other workers)."""
+        with self._lock:
+            return {
+                "days": self.days[start:].tolist(),
+                "amounts": self.amounts[start:].tolist(),
+                "merchants": [self.merchants[m] for m in self.merchant_ids[start:]],
+                "types": [TYPE_CODES[t] for t in self.type_codes[start:]],
+            }
+
+    def _view(self, code):
+        """Sorted view of one transaction type, brought up to date with any new rows."""
+        with self._lock:
+            n = len(self.amounts)
+            view = self._views.get(code)
+            done = self._indexed.get(code, 0)
+            if view is not None and done == n:
+                return view
+            days = np.frombuffer(self.days, dtype=np.int32)[done:n]
+            amounts = np.frombuffer(self.amounts, dtype=np.float64)[done:n]
+            merchants = np.frombuffer(self.merchant_ids, dtype=np.uint32)[done:n]
+            mask = np.frombuffer(self.type_codes, dtype=np.int8)[done:n] == code
+            days, amounts, merchants = days[mask], amounts[mask], merchants[mask]
+            order = np.argsort(days, kind="stable")
+            days, amounts, merchants = days[order], amounts[order], merchants[order]
+            if view is not None:
+                # New rows that all fall after the indexed ones are appended without re-sorting
+                in_order = not len(days) or not len(view.days) or days[0] >= view.days[-1]
+                days = np.concatenate((view.days, days))
+                amounts = np.concatenate((view.amounts, amounts))
+                merchants = np.concatenate((view.merchants, merchants))
+                if not in_order:
+                    order = np.argsort(days, kind="stable")
+                    days, amounts, merchants = days[order], amounts[order], merchants[order]
+            view = _View(days, amounts, merchants)
+            self._views = {k: v for k, v in self._views.items() if not isinstance(k, tuple) or k[0] != code}
+            self._views[code] = view
+            self._indexed[code] = n
+            return view
+
+    def _merchant_view(self, code, mid):
+        view = self._view(code)
+        with self._lock:
+            key = (code, mid)
+            cached = self._views.get(key)
+            if cached is None:
+                mask = view.merchants == mid
+                cached = self._views[key] = _View(view.days[mask], view.amounts[mask], view.merchants[mask])
+            return cached
+
+    def aggregate(self, start_day, end_day, group_by="day", ttype="credit", platform=None):
+        """
+        Sum, count, min and max of one transaction type between two day
+        ordinals (inclusive), bucketed by day, ISO week, month or platform.
+        Returns (buckets, overall).
+        """
+        if group_by not in GROUPINGS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUPINGS)}")
+        if ttype not in ("credit", "debit"):
+            raise ValueError("type must be 'credit' or 'debit'")
+        code = _TYPE_INDEX[ttype]
+        if platform is not None:
+            mid = self._merchant_index.get(platform)
+            if mid is None:
+                return [], _summary(np.empty(0), 0.0)
+            view = self._merchant_view(code, mid)
+        else:
+            view = self._view(code)
+
+        lo, hi = view.bounds(start_day, end_day)
+        hi = max(hi, lo)          # start after end: empty range
+        amounts = view.amounts[lo:hi]
+        overall = _summary(amounts, view.prefix[hi] - view.prefix[lo])
+        if hi == lo:
+            return [], overall
+
+        if group_by == "platform":
+            merchants = view.merchants[lo:hi]
+            order = np.argsort(merchants, kind="stable")
+            keys, amounts = merchants[order], amounts[order]
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            sums = np.add.reduceat(amounts, starts)
+            labels = [self.merchants[k] for k in keys[starts]]
+        else:
+            days = view.days[lo:hi]
+            if group_by == "day":
+                keys = days
+            elif group_by == "week":
+                keys = (days - 1) // 7          # ordinal 1 (0001-01-01) is a Monday
+            else:
+                keys = (days - _EPOCH_ORDINAL).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+            # Keys are sorted with the days, so buckets are contiguous runs
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            ends = np.r_[starts[1:], len(keys)]
+            sums = view.prefix[lo + ends] - view.prefix[lo + starts]
+            labels = [_bucket_label(group_by, int(k)) for k in keys[starts]]
+
+        counts = np.diff(np.r_[starts, len(amounts)])
+        mins = np.minimum.reduceat(amounts, starts)
+        maxs = np.maximum.reduceat(amounts, starts)
+        buckets = [
+            {"key": label, "sum": round(float(s), 2), "count": int(c), "min": float(mn), "max": float(mx)}
+            for label, s, c, mn, mx in zip(labels, sums, counts, mins, maxs)
+        ]
+        if group_by == "platform":
+            buckets.sort(key=lambda b: b["sum"], reverse=True)
+        return buckets, overall
+
+
+def _summary(amounts, total):
+    count = len(amounts)
+    return {
+        "sum": round(float(total), 2),
+        "count": int(count),
+        "min": float(amounts.min()) if count else None,
+        "max": float(amounts.max()) if count else None,
+    }
+
+
+def _bucket_label(group_by, key):
+    if group_by == "day":
+        return date.fromordinal(key).isoformat()
+    if group_by == "week":
+        return date.fromordinal(key * 7 + 1).isoformat()   # Monday the week starts on
+    return f"{1970 + key // 12:04d}-{key % 12 + 1:02d}"
+
+
+class TransactionLedgers:
+    """
+    Ledgers by user. With a shared StateBackend each append batch is also
+    written there as a chunk, and other workers pull chunks they have not
+    seen before answering a query, so every worker reports the same totals.
+
+    Rows are recorded by the EarningsStore they are attached to, in the same
+    commit (and earnings log event batch) as the credits they describe, so
+    a restart restores both from the same place.
+    """
+
+    NAMESPACE = "ledger"
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.shared = backend.name != "memory"
+        self._ledgers = {}
+        self._synced = {}         # user -> chunks applied locally
+        self._epoch = None
+        self._lock = threading.Lock()
+        # Held from reading a ledger's length to pushing the rows appended
+        # after it, and while pulling, so another thread's pull never lands
+        # in between and gets pushed again as our chunk
+        self._sync_lock = threading.RLock()
+
+    def get(self, user_id):
+        if self.shared:
+            # Another worker may have cleared every ledger since our last look
+            epoch = self.backend.get("ledger_epoch", "epoch", 0)
+            if epoch != self._epoch:
+                with self._lock:
+                    self._ledgers.clear()
+                    self._synced.clear()
+                    self._epoch = epoch
+        with self._lock:
+            ledger = self._ledgers.get(user_id)
+            if ledger is None:
+                ledger = self._ledgers[user_id] = TransactionLedger()
+                self._synced[user_id] = 0
+        if self.shared:
+            with self._sync_lock:
+                self._pull(user_id, ledger)
+        return ledger
+
+    def _pull(self, user_id, ledger):
+        chunks = self.backend.get(self.NAMESPACE, f"{user_id}:chunks", 0)
+        while self._synced[user_id] < chunks:
+            rows = self.backend.get(self.NAMESPACE, f"{user_id}:{self._synced[user_id]}")
+            if rows is not None:
+                ledger.extend_rows(rows["days"], rows["amounts"], rows["merchants"], rows["types"])
+            self._synced[user_id] += 1
+
+    def _push(self, user_id, ledger, start):
+        if not self.shared or len(ledger) == start:
+            return
+        rows = ledger.rows_since(start)
+        with self.backend.lock(self.NAMESPACE):
+            # Take in chunks other workers wrote meanwhile, so ours is not pulled back later
+            self._pull(user_id, ledger)
+            chunk = self._synced[user_id]
+            self.backend.set(self.NAMESPACE, f"{user_id}:{chunk}", rows)
+            self.backend.set(self.NAMESPACE, f"{user_id}:chunks", chunk + 1)
+            self._synced[user_id] = chunk + 1
+
+    def record(self, user_id, rows):
+        """Append rows ({"days", "amounts", "merchants", "types"} lists) to a user's ledger."""
+        ledger = self.get(user_id)
+        with self._sync_lock:
+            start = len(ledger)
+            ledger.extend_rows(rows["days"], rows["amounts"], rows["merchants"], rows["types"])
+            self._push(user_id, ledger, start)
+
+    def dump(self):
+        """Every local ledger as {user: rows}, for the earnings log snapshot."""
+        with self._lock:
+            ledgers = list(self._ledgers.items())
+        return {user_id: ledger.rows_since(0) for user_id, ledger in ledgers}
+
+    def load(self, dump):
+        """Replace the local ledgers with a dump() (memory backend restore only)."""
+        with self._lock:
+            self._ledgers.clear()
+            self._synced.clear()
+        for user_id, rows in dump.items():
+            self.record(user_id, rows)
+
+    def clear(self):
+        with self._lock:
+            self._ledgers.clear()
+            self._synced.clear()
+        self.backend.clear(self.NAMESPACE)
+        if self.shared:
+            self._epoch = self.backend.transform("ledger_epoch", "epoch", lambda e: e + 1, 0)
@@ -1,5 +1,5 @@
 import { createContext, useContext, useState, useEffect, useCallback, type ReactNode } from 'react';
-import { API_BASE_URL } from './config';
+import { fetchAllPages } from './config';
 
 interface IncomeSource {
   name: string;
@@ -36,9 +36,7 @@ export function EarningsProvider({ children }: { children: ReactNode }) {
     setLoading(true);
     setError(null);
     try {
-      const res = await fetch(`${API_BASE_URL}/api/dashboard`);
-      if (!res.ok) throw new Error('Backend not responding');
-      const data = await res.json();
+      const data = await fetchAllPages('/api/dashboard', 'incomeSources', 'nextCursor');
       setIncomeSources(data.incomeSources || []);
       setMonthlyData(data.earningsData || []);
     } catch (err) {
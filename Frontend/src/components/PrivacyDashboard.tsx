@@ -5,7 +5,7 @@ import {
     Shield, ShieldCheck, Download, Trash2, ToggleLeft, ToggleRight,
     Lock, AlertTriangle, CheckCircle, FileText, Eye
 } from 'lucide-react';
-import { API_BASE_URL } from '../config';
+import { API_BASE_URL, fetchAllPages } from '../config';
 import { PrivacyBadge } from './PrivacyBadge';
 
 // Permission keys stored in localStorage
@@ -57,8 +57,7 @@ export function PrivacyDashboard() {
     const handleExport = async () => {
         setExportLoading(true);
         try {
-            const res = await fetch(`${API_BASE_URL}/api/export_earnings`);
-            const data = await res.json();
+            const data = await fetchAllPages('/api/export_earnings', 'income_sources', 'next_cursor');
             const blob = new Blob([JSON.stringify(data, null, 2)], { type: 'application/json' });
             const url = URL.createObjectURL(blob);
             const a = document.createElement('a');
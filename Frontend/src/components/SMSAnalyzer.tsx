@@ -35,7 +35,7 @@ export function SMSAnalyzer() {
             const response = await fetch(`${API_BASE_URL}/api/parse_sms`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ messages: messageList })
+                body: JSON.stringify({ messages: messageList, include_raw: true })
             });
 
             const data = await response.json();
@@ -22,8 +22,8 @@ export function SchemesPage() {
     fetch(`${API_BASE_URL}/api/dashboard`)
       .then(res => res.json())
       .then(dashboardData => {
-        const sources = dashboardData.incomeSources || [];
-        const monthlyTotal = sources.reduce((sum: number, s: any) => sum + s.amount, 0);
+        // The server total covers every source, not just the first page
+        const monthlyTotal = dashboardData.totalMonthlyIncome || 0;
         const annualIncome = monthlyTotal * 12;
 
         const userProfile = {
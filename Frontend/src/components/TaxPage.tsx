@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react';
 import jsPDF from 'jspdf';
 import autoTable from 'jspdf-autotable';
-import { API_BASE_URL } from '../config';
+import { API_BASE_URL, fetchAllPages } from '../config';
 
 import { Card } from './ui/card';
 import { Button } from './ui/button';
@@ -58,8 +58,7 @@ export function TaxPage() {
       .finally(() => setIsLoading(false));
 
     // Fetch income sources for PDF
-    fetch(`${API_BASE_URL}/api/dashboard`)
-      .then(res => res.json())
+    fetchAllPages('/api/dashboard', 'incomeSources', 'nextCursor')
       .then(data => {
         setIncomeSources(data.incomeSources || []);
       })
@@ -1 +1,19 @@
 export const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+
+// /api/dashboard and /api/export_earnings return income sources one page at a
+// time. Follow the cursor to the last page and merge the pages into one response.
+export async function fetchAllPages(path: string, itemsKey: string, cursorKey: string): Promise<any> {
+  let first: any = null;
+  let items: any[] = [];
+  let cursor: string | null = null;
+  do {
+    const query: string = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+    const res = await fetch(`${API_BASE_URL}${path}${query}`);
+    if (!res.ok) throw new Error(`${path} responded ${res.status}`);
+    const page = await res.json();
+    first = first ?? page;
+    items = items.concat(page[itemsKey] || []);
+    cursor = page[cursorKey] ?? null;
+  } while (cursor);
+  return { ...first, [itemsKey]: items, [cursorKey]: null };
+}